@@ -0,0 +1,505 @@
+from typing import List, Dict, TYPE_CHECKING
+import numpy as np
+from Model.CitySnapshot import CitySnapshot
+from Model.Direction import Direction
+from Model.Instrumentation import INSTRUMENTATION
+from Model.Junction import REGULAR_JUNCTION_LIMIT, HIGHWAY_JUNCTION_LIMIT
+from Model.Solution import to_solution_array
+
+if TYPE_CHECKING:
+    from Model.City import City
+
+# The arrays that describe the simulated scenarios. They never change during a simulation, so they can be shared
+# between engines and processes.
+STATIC_ARRAYS = ('paths', 'directions', 'path_lengths', 'template_start_times', 'car_templates', 'car_sims',
+                 'vertical_highway', 'horizontal_highway')
+
+
+class ArrayEngine:
+    """
+    A structure-of-arrays simulation engine.
+    The state of one or more simulations that share the same n x m layout is kept in flat NumPy arrays (one entry
+    per car) and a tick is a handful of vectorized operations. The tick semantics mirror Grid and Junction exactly:
+    the capacity limits, the longest-waiting-first order and its tie break by arrival order, so every metric is
+    identical to the object engine.
+    """
+
+    def __init__(self, n: int, m: int, num_sims: int, paths: np.ndarray, directions: np.ndarray,
+                 path_lengths: np.ndarray, start_times: np.ndarray, car_templates: np.ndarray, car_sims: np.ndarray,
+                 vertical_highway: np.ndarray, horizontal_highway: np.ndarray, car_ids: List[str] = None,
+                 keep_wait_history: bool = False):
+        """
+        The static car data (path, directions, departure time) is stored once per template car, so the same
+        scenario can be simulated many times without copying it.
+        :param n: Number of rows in the grid.
+        :param m: Number of columns in the grid.
+        :param num_sims: Number of simulations stacked in the engine.
+        :param paths: A (templates, max_path_length) array of junction indices (x * m + y), padded with the
+            destination.
+        :param directions: A (templates, max_path_length) array of the direction at each path step (Direction values).
+        :param path_lengths: The path length of each template.
+        :param start_times: The departure time of each template.
+        :param car_templates: The template of each simulated car.
+        :param car_sims: The simulation of each simulated car, cars of a simulation must be contiguous.
+        :param vertical_highway: A flat (n * m) boolean array of the vertical highway junctions.
+        :param horizontal_highway: A flat (n * m) boolean array of the horizontal highway junctions.
+        :param car_ids: The ids of the templates, used to rebuild the junctions wait time dictionaries.
+        :param keep_wait_history: Keep the wait time of every car at every junction of its path, a (cars,
+            max_path_length) array needed by snapshot and get_all_junctions_wait_time. Without it a car only has
+            running wait counters, and the memory of the engine doesn't grow with the path lengths.
+        """
+        self.n = n
+        self.m = m
+        self.num_sims = num_sims
+        self.paths = paths
+        self.directions = directions
+        self.path_lengths = path_lengths
+        self.template_start_times = start_times
+        self.car_templates = car_templates
+        self.last_indices = path_lengths[car_templates] - 1
+        self.car_sims = car_sims
+        self.car_ids = car_ids
+        self.keep_wait_history = keep_wait_history
+        self.num_cars = np.bincount(car_sims, minlength=num_sims)
+        self.car_offsets = np.concatenate(([0], np.cumsum(self.num_cars)))
+        self.vertical_highway = vertical_highway
+        self.horizontal_highway = horizontal_highway
+        self.vertical_limits = np.where(vertical_highway, HIGHWAY_JUNCTION_LIMIT, REGULAR_JUNCTION_LIMIT)
+        self.horizontal_limits = np.where(horizontal_highway, HIGHWAY_JUNCTION_LIMIT, REGULAR_JUNCTION_LIMIT)
+        self.reset()
+
+    @classmethod
+    def from_cities(cls, cities: List['City'], keep_wait_history: bool = False) -> 'ArrayEngine':
+        """
+        Build an engine holding one simulation per city. All the cities must share the same dimensions.
+        :param cities: The cities to simulate.
+        :param keep_wait_history: See __init__.
+        :return: An ArrayEngine at time 0.
+        """
+        n, m = cities[0].n, cities[0].m
+        path_arrays = [city.get_path_arrays() for city in cities]
+        path_lengths = np.concatenate([np.diff(offsets) for offsets, _ in path_arrays]).astype(np.int32)
+        flat_paths = np.concatenate([paths for _, paths in path_arrays])
+        num_cars = len(path_lengths)
+        max_path_length = path_lengths.max(initial=1)
+
+        # Scatter the packed paths into rows, then pad every row with its destination
+        rows = np.repeat(np.arange(num_cars), path_lengths)
+        columns = np.arange(len(flat_paths)) - np.repeat(np.cumsum(path_lengths) - path_lengths, path_lengths)
+        paths = np.zeros((num_cars, max_path_length), dtype=np.int32)
+        paths[rows, columns] = flat_paths
+        destinations = paths[np.arange(num_cars), path_lengths - 1]
+        paths = np.where(np.arange(max_path_length) >= path_lengths[:, None], destinations[:, None], paths)
+
+        xs = paths // m
+        directions = np.zeros((num_cars, max_path_length), dtype=np.uint8)
+        directions[:, :-1] = xs[:, 1:] != xs[:, :-1]
+
+        cars = [car for city in cities for car in city.cars]
+        start_times = np.array([car.start_time for car in cars], dtype=np.int32)
+        car_sims = np.repeat(np.arange(len(cities)), [len(city.cars) for city in cities])
+        grid = cities[0].grid
+        return cls(n, m, len(cities), paths, directions, path_lengths, start_times, np.arange(len(cars)), car_sims,
+                   grid.is_vertical_highway.reshape(-1), grid.is_horizontal_highway.reshape(-1),
+                   [car.id for car in cars], keep_wait_history)
+
+    @classmethod
+    def from_static_arrays(cls, n: int, m: int, num_sims: int, arrays: Dict[str, np.ndarray]) -> 'ArrayEngine':
+        """
+        Build an engine from the arrays returned by get_static_arrays.
+        :param n: Number of rows in the grid.
+        :param m: Number of columns in the grid.
+        :param num_sims: Number of simulations stacked in the engine.
+        :param arrays: A dictionary with an entry for each name in STATIC_ARRAYS.
+        :return: An ArrayEngine at time 0.
+        """
+        return cls(n, m, num_sims, arrays['paths'], arrays['directions'], arrays['path_lengths'],
+                   arrays['template_start_times'], arrays['car_templates'], arrays['car_sims'],
+                   arrays['vertical_highway'], arrays['horizontal_highway'])
+
+    def get_static_arrays(self) -> Dict[str, np.ndarray]:
+        """Return the arrays that describe the simulated scenarios, by their names in STATIC_ARRAYS."""
+        return {name: getattr(self, name) for name in STATIC_ARRAYS}
+
+    def tile(self, repeats: int) -> 'ArrayEngine':
+        """
+        Build an engine that runs the simulations of this engine `repeats` times side by side, sharing its static
+        car data. Simulation s of copy r is simulation r * num_sims + s of the new engine.
+        :param repeats: The number of copies.
+        :return: An ArrayEngine at time 0.
+        """
+        sim_shifts = np.repeat(np.arange(repeats) * self.num_sims, len(self.car_sims))
+        return ArrayEngine(self.n, self.m, self.num_sims * repeats, self.paths, self.directions, self.path_lengths,
+                           self.template_start_times, np.tile(self.car_templates, repeats),
+                           np.tile(self.car_sims, repeats) + sim_shifts,
+                           self.vertical_highway, self.horizontal_highway, self.car_ids)
+
+    def select(self, sims: np.ndarray) -> 'ArrayEngine':
+        """
+        Build an engine holding a copy of the current state of the given simulations, sharing the static car data.
+        A simulation may be selected several times, to branch it.
+        :param sims: The simulations to copy, simulation k of the new engine is a copy of simulation sims[k].
+        :return: An ArrayEngine at the current time.
+        """
+        lengths = self.num_cars[sims]
+        cars = np.repeat(self.car_offsets[sims] - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+        engine = ArrayEngine(self.n, self.m, len(sims), self.paths, self.directions, self.path_lengths,
+                             self.template_start_times, self.car_templates[cars],
+                             np.repeat(np.arange(len(sims)), lengths),
+                             self.vertical_highway, self.horizontal_highway, self.car_ids, self.keep_wait_history)
+        engine.time = self.time
+        engine.sim_start_times = self.sim_start_times[sims]
+        engine.start_times = self.start_times[cars]
+        engine.sort_departures()
+        engine.indices = self.indices[cars]
+        engine.in_grid = self.in_grid[cars]
+        engine.arrived = self.arrived[cars]
+        engine.current_waits = self.current_waits[cars]
+        engine.finished_waits = self.finished_waits[cars]
+        engine.finished_squared_waits = self.finished_squared_waits[cars]
+        if self.wait_history is not None:
+            engine.wait_history = self.wait_history[cars]
+        engine.arrival_order = self.arrival_order[cars]
+        engine.arrival_counter = self.arrival_counter
+        engine.active_cars = self.active_cars[sims]
+        engine.total_car_movements = self.total_car_movements[sims]
+        engine.lights = self.lights.reshape(self.num_sims, -1)[sims].reshape(-1)
+        return engine
+
+    def reset(self) -> None:
+        """Bring all the simulations back to time 0."""
+        num_cars = len(self.car_sims)
+        self.time = 0
+        # The engine time every simulation started at, later than 0 for the simulations restarted by reset_sims
+        self.sim_start_times = np.zeros(self.num_sims, dtype=np.int64)
+        self.start_times = self.template_start_times[self.car_templates]
+        self.sort_departures()
+        self.indices = np.zeros(num_cars, dtype=np.int32)
+        self.in_grid = np.zeros(num_cars, dtype=bool)
+        self.arrived = np.zeros(num_cars, dtype=bool)
+        # The wait time of every car at its current junction, and the sum and the sum of squares of its wait times
+        # at the junctions it left
+        self.current_waits = np.zeros(num_cars, dtype=np.int32)
+        self.finished_waits = np.zeros(num_cars, dtype=np.int64)
+        self.finished_squared_waits = np.zeros(num_cars, dtype=np.int64)
+        # The wait time of every car at the junctions it left, by path step, see keep_wait_history
+        self.wait_history = np.zeros((num_cars, self.paths.shape[1]), dtype=np.int32) if self.keep_wait_history \
+            else None
+        self.arrival_order = np.zeros(num_cars, dtype=np.int64)
+        self.arrival_counter = 0
+        self.active_cars = self.num_cars.astype(np.int64)
+        self.total_car_movements = np.zeros(self.num_sims, dtype=np.int64)
+        self.lights = np.zeros(self.num_sims * self.n * self.m, dtype=np.uint8)
+
+    def sort_departures(self) -> None:
+        self.departure_order = np.argsort(self.start_times, kind='stable')
+        self.departure_times = self.start_times[self.departure_order]
+
+    def reset_sims(self, sims: np.ndarray) -> None:
+        """
+        Restart the given simulations at the current time, as if they were at their time 0, while the other
+        simulations go on. Their cars depart relative to the current time, see sim_times.
+        :param sims: The simulations to restart.
+        """
+        sims = np.asarray(sims, dtype=np.int64)
+        if len(sims) == 0:
+            return
+        cars = np.isin(self.car_sims, sims)
+        self.start_times[cars] = self.template_start_times[self.car_templates[cars]] + self.time
+        self.sort_departures()
+        self.indices[cars] = 0
+        self.in_grid[cars] = False
+        self.arrived[cars] = False
+        self.current_waits[cars] = 0
+        self.finished_waits[cars] = 0
+        self.finished_squared_waits[cars] = 0
+        if self.wait_history is not None:
+            self.wait_history[cars] = 0
+        self.active_cars[sims] = self.num_cars[sims]
+        self.total_car_movements[sims] = 0
+        self.sim_start_times[sims] = self.time
+
+    def sim_times(self) -> np.ndarray:
+        """Return the time of every simulation, the number of ticks since it started."""
+        return self.time - self.sim_start_times
+
+    def drained_sims(self) -> np.ndarray:
+        """Return a mask of the simulations that can't change anymore, see is_drained."""
+        last_departures = np.full(self.num_sims, -1, dtype=np.int64)
+        np.maximum.at(last_departures, self.car_sims, self.start_times)
+        in_grid = np.bincount(self.car_sims[self.in_grid], minlength=self.num_sims)
+        return (self.time > last_departures) & (in_grid == 0)
+
+    @staticmethod
+    def to_light_states(assignments: np.ndarray) -> np.ndarray:
+        """Convert assignments of any shape to their uint8 Direction values, see Model.Solution.to_solution_array."""
+        return to_solution_array(assignments)
+
+    def to_lights(self, assignment: np.ndarray) -> np.ndarray:
+        """
+        Convert an assignment to a flat array of light states (Direction values).
+        :param assignment: An (n, m) assignment for every simulation, or a (num_sims, n, m) stack of assignments.
+            Either Direction objects or their integer values.
+        :return: A flat uint8 array of num_sims * n * m light states.
+        """
+        assignment = np.asarray(assignment)
+        if assignment.shape[-2:] != (self.n, self.m):
+            raise ValueError("Assignment dimensions do not match traffic light grid dimensions")
+
+        # uint8 solutions were validated when they entered the solver, any other assignment is validated here
+        lights = np.broadcast_to(to_solution_array(assignment, validate=False), (self.num_sims, self.n, self.m))
+        return lights.reshape(-1)
+
+    def update(self, assignment: np.ndarray) -> None:
+        """
+        Forward all the simulations by one tick of time.
+        :param assignment: See to_lights.
+        """
+        self.lights = self.to_lights(assignment)
+        self.remove_arrived_cars()
+        self.move_cars()
+        self.add_departing_cars()
+        self.time += 1
+
+    def is_drained(self) -> bool:
+        """Return True if no simulation can change anymore: all the cars departed and left the grid."""
+        return self.time > self.departure_times.max(initial=-1) and not self.in_grid.any()
+
+    def fast_forward(self, assignments: np.ndarray) -> None:
+        """
+        Skip ticks of drained simulations, only the last assignment is applied to the lights.
+        :param assignments: The assignments of the skipped ticks, see to_lights.
+        """
+        self.lights = self.to_lights(assignments[-1])
+        self.time += len(assignments)
+
+    def remove_arrived_cars(self) -> None:
+        """Remove all the cars that arrived to their destination from the grid."""
+        at_destination = (self.indices == self.last_indices) & ~self.arrived
+        if not at_destination.any():
+            return
+        self.active_cars -= np.bincount(self.car_sims[at_destination], minlength=self.num_sims)
+        reached = at_destination & self.in_grid
+        self.arrived |= reached
+        self.in_grid &= ~reached
+
+    def move_cars(self) -> None:
+        """Resolve every junction and move the cars that got a green light."""
+        cars = np.flatnonzero(self.in_grid)
+        if len(cars) == 0:
+            return
+
+        indices = self.indices[cars]
+        templates = self.car_templates[cars]
+        local_junctions = self.paths[templates, indices]
+        junctions = self.car_sims[cars] * (self.n * self.m) + local_junctions
+        lights = self.lights[junctions]
+        candidates = np.flatnonzero(self.directions[templates, indices] == lights)
+
+        candidate_junctions = junctions[candidates]
+        # Longest waiting cars first, ties are broken by the order the cars entered the junction
+        order = np.lexsort((self.arrival_order[cars[candidates]],
+                            -self.current_waits[cars[candidates]],
+                            candidate_junctions))
+        sorted_junctions = candidate_junctions[order]
+        group_starts = np.flatnonzero(np.r_[True, sorted_junctions[1:] != sorted_junctions[:-1]])
+        group_sizes = np.diff(np.r_[group_starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(group_starts, group_sizes)
+        sorted_candidates = candidates[order]
+        limits = np.where(lights[sorted_candidates] == Direction.VERTICAL.value,
+                          self.vertical_limits[local_junctions[sorted_candidates]],
+                          self.horizontal_limits[local_junctions[sorted_candidates]])
+        moving_cars = cars[sorted_candidates[ranks < limits]]
+        INSTRUMENTATION.count('junctions_visited', len(group_starts))
+        INSTRUMENTATION.count('cars_moved', len(moving_cars))
+
+        self.current_waits[cars] += 1
+        # The moving cars leave their junction, their wait there is folded into their totals
+        moving_waits = self.current_waits[moving_cars]
+        if self.wait_history is not None:
+            self.wait_history[moving_cars, self.indices[moving_cars]] = moving_waits
+        self.finished_waits[moving_cars] += moving_waits
+        self.finished_squared_waits[moving_cars] += np.square(moving_waits, dtype=np.int64)
+        self.current_waits[moving_cars] = 0
+        self.total_car_movements += np.bincount(self.car_sims[moving_cars], minlength=self.num_sims)
+        self.indices[moving_cars] += 1
+        self.mark_arrivals(moving_cars)
+
+    def add_departing_cars(self) -> None:
+        """Add all the cars that depart at the current time to the grid."""
+        start = np.searchsorted(self.departure_times, self.time, side='left')
+        end = np.searchsorted(self.departure_times, self.time, side='right')
+        departing_cars = self.departure_order[start:end]
+        self.in_grid[departing_cars] = True
+        self.mark_arrivals(departing_cars)
+
+    def mark_arrivals(self, cars: np.ndarray) -> None:
+        """Record the order in which the given cars entered their current junction."""
+        self.arrival_order[cars] = self.arrival_counter + np.arange(len(cars))
+        self.arrival_counter += len(cars)
+
+    def departed(self) -> np.ndarray:
+        """Return a mask of the cars that were already added to the grid."""
+        return self.start_times < self.time
+
+    def active_cars_amount(self, sim: int = 0) -> int:
+        return int(self.active_cars[sim])
+
+    def get_total_cars_movements(self, sim: int = 0) -> int:
+        return int(self.total_car_movements[sim])
+
+    def get_total_wait_times(self) -> np.ndarray:
+        """Return the sum of all junctions wait times for every simulation."""
+        per_car = self.finished_waits + self.current_waits
+        return np.bincount(self.car_sims, weights=per_car, minlength=self.num_sims)
+
+    def get_total_avg_wait_time(self, sim: int = 0) -> float:
+        return self.get_total_wait_times()[sim] / (self.m * self.n)
+
+    def get_wait_time_punishments(self) -> np.ndarray:
+        """Return the sum of the squared junction wait times of every car for every simulation."""
+        per_car = self.finished_squared_waits + np.square(self.current_waits, dtype=np.int64)
+        return np.bincount(self.car_sims, weights=per_car, minlength=self.num_sims)
+
+    def get_metrics(self, group_size: int = 1) -> np.ndarray:
+        """
+        Sum the evaluation metrics over consecutive groups of simulations.
+        :param group_size: The number of simulations in each group.
+        :return: A (4, num_sims // group_size) array of the not reaching cars, the total average wait time, the car
+            movements and the wait time punishment of each group, the arguments order of Solver.evaluate.
+        """
+        avg_wait_times = (self.get_total_wait_times() / (self.m * self.n)).reshape(-1, group_size)
+        # Accumulate simulation by simulation, the same order Solver.evaluate_solution sums the cities in
+        total_avg_wait_times = np.zeros(len(avg_wait_times))
+        for sim in range(group_size):
+            total_avg_wait_times += avg_wait_times[:, sim]
+
+        return np.stack((self.active_cars.reshape(-1, group_size).sum(axis=1),
+                         total_avg_wait_times,
+                         self.total_car_movements.reshape(-1, group_size).sum(axis=1),
+                         self.get_wait_time_punishments().reshape(-1, group_size).sum(axis=1)))
+
+    def simulate_solutions(self, solutions: np.ndarray) -> np.ndarray:
+        """
+        Run every solution over all the simulations of this engine, side by side in a tiled engine.
+        :param solutions: A (P, t, n, m) array of solutions.
+        :return: The (4, P) metrics of each solution, see get_metrics.
+        """
+        solutions = self.to_light_states(solutions)
+        engine = self.tile(len(solutions))
+        for t in range(solutions.shape[1]):
+            if engine.is_drained():
+                break
+            engine.update(np.repeat(solutions[:, t], self.num_sims, axis=0))
+        return engine.get_metrics(self.num_sims)
+
+    def get_queue_counts(self, sim: int = 0) -> np.ndarray:
+        """Return the (n, m, 2) number of cars in the junctions of a simulation, by the Direction value they wait to go."""
+        cars = self.car_offsets[sim] + np.flatnonzero(self.in_grid[self.car_offsets[sim]:self.car_offsets[sim + 1]])
+        templates, indices = self.car_templates[cars], self.indices[cars]
+        queues = self.paths[templates, indices] * 2 + self.directions[templates, indices]
+        return np.bincount(queues, minlength=self.n * self.m * 2).reshape(self.n, self.m, 2)
+
+    def get_state_tensors(self) -> np.ndarray:
+        """Return the (num_sims, n, m, 4) states of all the simulations, see Grid.get_state_tensor."""
+        cars = np.flatnonzero(self.in_grid)
+        templates, indices = self.car_templates[cars], self.indices[cars]
+        queues = (self.car_sims[cars] * (self.n * self.m) + self.paths[templates, indices]) * 2 \
+            + self.directions[templates, indices]
+        queue_counts = np.bincount(queues, minlength=self.num_sims * self.n * self.m * 2)
+        queue_counts = queue_counts.reshape(self.num_sims, self.n, self.m, 2)
+        highways = np.broadcast_to(np.stack((self.vertical_highway.reshape(self.n, self.m),
+                                             self.horizontal_highway.reshape(self.n, self.m)), axis=-1),
+                                   (self.num_sims, self.n, self.m, 2))
+        return np.concatenate((queue_counts[..., [Direction.VERTICAL.value, Direction.HORIZONTAL.value]],
+                               highways), axis=-1).astype(int)
+
+    def get_state_tensor(self, sim: int = 0) -> np.ndarray:
+        """Return the (n, m, 4) state of a simulation, see Grid.get_state_tensor."""
+        queue_counts = self.get_queue_counts(sim)
+        return np.stack((queue_counts[:, :, Direction.VERTICAL.value],
+                         queue_counts[:, :, Direction.HORIZONTAL.value],
+                         self.vertical_highway.reshape(self.n, self.m),
+                         self.horizontal_highway.reshape(self.n, self.m)), axis=-1).astype(int)
+
+    def get_all_junctions_wait_time(self, sim: int = 0) -> List[List[Dict[str, int]]]:
+        """Rebuild the per junction wait time dictionaries of a simulation, same as Grid.get_all_junctions_wait_time"""
+        cars = slice(self.car_offsets[sim], self.car_offsets[sim + 1])
+        car_wait_times = self.get_wait_history(cars)
+        wait_times = [[dict() for _ in range(self.m)] for _ in range(self.n)]
+        departed = self.departed()[cars]
+        for car in range(len(departed)):
+            if not departed[car]:
+                continue
+            template = self.car_templates[cars][car]
+            for step in range(self.indices[cars][car] + 1):
+                x, y = divmod(int(self.paths[template, step]), self.m)
+                wait_times[x][y][self.car_ids[template]] = int(car_wait_times[car, step])
+        return wait_times
+
+    def get_wait_history(self, cars: slice) -> np.ndarray:
+        """
+        Return the (cars, max_path_length) wait times of the given cars at every junction of their path, the
+        current junction included.
+        :raises ValueError: If the engine keeps no wait history.
+        """
+        if self.wait_history is None:
+            raise ValueError("The engine keeps no wait history, see keep_wait_history")
+        wait_times = self.wait_history[cars].copy()
+        wait_times[np.arange(len(wait_times)), self.indices[cars]] = self.current_waits[cars]
+        return wait_times
+
+    def snapshot(self, sim: int = 0) -> CitySnapshot:
+        """
+        Capture the state of a simulation.
+        :param sim: The simulation to capture.
+        :return: A CitySnapshot that owns its arrays.
+        """
+        cars = slice(self.car_offsets[sim], self.car_offsets[sim + 1])
+        in_grid = self.in_grid[cars].copy()
+        in_grid_cars = np.flatnonzero(in_grid)
+        arrival_ranks = np.zeros(len(in_grid), dtype=np.int32)
+        # Rank the cars junction by junction, so both engines capture the same snapshot
+        junctions = self.paths[self.car_templates[cars][in_grid_cars], self.indices[cars][in_grid_cars]]
+        order = np.lexsort((self.arrival_order[cars][in_grid_cars], junctions))
+        arrival_ranks[in_grid_cars[order]] = np.arange(len(in_grid_cars))
+
+        indices, arrived = self.indices[cars].copy(), self.arrived[cars].copy()
+        visited_counts = (indices + 1) * (in_grid | arrived)
+        visited = np.arange(self.paths.shape[1]) < visited_counts[:, None]
+        lights = self.lights[sim * self.n * self.m:(sim + 1) * self.n * self.m].reshape(self.n, self.m).copy()
+        return CitySnapshot(self.time, self.active_cars_amount(sim), self.get_total_cars_movements(sim), lights,
+                            indices, arrived, in_grid, arrival_ranks, self.get_wait_history(cars)[visited])
+
+    def restore(self, snapshot: CitySnapshot, sim: int = 0) -> None:
+        """
+        Bring a simulation back to a captured state. The time is shared by all the simulations, so it is set to
+        the snapshot time.
+        :param snapshot: A snapshot of a simulation of the same scenario.
+        :param sim: The simulation to restore.
+        """
+        if snapshot.num_cars != self.num_cars[sim] or snapshot.lights.shape != (self.n, self.m):
+            raise ValueError("Snapshot does not match the simulation dimensions")
+        cars = slice(self.car_offsets[sim], self.car_offsets[sim + 1])
+        self.time = snapshot.time
+        self.indices[cars] = snapshot.indices
+        self.arrived[cars] = snapshot.arrived
+        self.in_grid[cars] = snapshot.in_grid
+        # Keep the arrival order increasing, the cars that enter junctions later must be ordered after these
+        self.arrival_order[cars] = self.arrival_counter + snapshot.arrival_ranks
+        self.arrival_counter += snapshot.num_cars
+        visited = np.arange(self.paths.shape[1]) < snapshot.visited_counts()[:, None]
+        wait_times = np.zeros((snapshot.num_cars, self.paths.shape[1]), dtype=np.int32)
+        wait_times[visited] = snapshot.wait_times
+        current_waits = wait_times[np.arange(snapshot.num_cars), snapshot.indices]
+        self.current_waits[cars] = current_waits
+        self.finished_waits[cars] = wait_times.sum(axis=1, dtype=np.int64) - current_waits
+        self.finished_squared_waits[cars] = (np.square(wait_times, dtype=np.int64).sum(axis=1)
+                                             - np.square(current_waits, dtype=np.int64))
+        if self.wait_history is not None:
+            self.wait_history[cars] = wait_times
+        self.active_cars[sim] = snapshot.active_cars
+        self.total_car_movements[sim] = snapshot.total_car_movements
+        # The lights may be a read only broadcast of the last assignment
+        self.lights = self.lights.copy()
+        self.lights[sim * self.n * self.m:(sim + 1) * self.n * self.m] = snapshot.lights.reshape(-1)
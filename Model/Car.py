@@ -9,7 +9,10 @@ NOISE_CAR_PATH = 0.03
 
 class Car:
     def __init__(self, car_id: str, source: Coordinate, destination: Coordinate, start_time: int,
-                 get_highway_direction: Callable[[Coordinate], List[Direction]]):
+                 get_highway_direction: Callable[[Coordinate], List[Direction]], path: List[Coordinate] = None):
+        """
+        :param path: A precomputed path from the source to the destination. If not given, a path is chosen.
+        """
         self._id: str = car_id
         self._source: Coordinate = source
         self._destination: Coordinate = destination
@@ -18,18 +21,22 @@ class Car:
         self._start_time: int = start_time
         self._did_arrive: bool = False
         self._get_highway_direction = get_highway_direction
-        self._init_path()
+        if path is None:
+            self._init_path()
+        else:
+            self._path = path
 
     @classmethod
     def copy_constructor(cls, other_car: 'Car') -> 'Car':
+        # Coordinates are immutable, so the copy shares them and only copies the path list
         new_car = cls(
             car_id=other_car._id,
-            source=Coordinate(other_car._source.x, other_car._source.y),
-            destination=Coordinate(other_car._destination.x, other_car._destination.y),
+            source=other_car._source,
+            destination=other_car._destination,
             start_time=other_car._start_time,
-            get_highway_direction=other_car._get_highway_direction
+            get_highway_direction=other_car._get_highway_direction,
+            path=list(other_car._path)
         )
-        new_car._path = list(other_car._path)
         new_car._current_location_index = other_car._current_location_index
         new_car._did_arrive = other_car._did_arrive
         return new_car
@@ -50,6 +57,10 @@ class Car:
     def current_location(self) -> Coordinate:
         return self._path[self._current_location_index]
 
+    @property
+    def current_location_index(self) -> int:
+        return self._current_location_index
+
     @property
     def start_time(self) -> int:
         return self._start_time
@@ -80,6 +91,9 @@ class Car:
     def set_did_arrive(self, arrive: bool):
         self._did_arrive = arrive
 
+    def set_current_location_index(self, index: int):
+        self._current_location_index = index
+
     def _init_path(self) -> None:
         """
         Choose a path from the source coordinate to the destination coordinate.
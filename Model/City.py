@@ -1,37 +1,174 @@
 import random
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
+import numpy as np
 from numpy import ndarray
+from numpy.lib.stride_tricks import sliding_window_view
+from Model.ArrayEngine import ArrayEngine
 from Model.Car import Car
-from Model.TrafficLight import TrafficLight
+from Model.CitySnapshot import CitySnapshot
+from Model.Instrumentation import INSTRUMENTATION
+from Model.TrafficLight import TrafficLight, init_signal_plane
 from Model.Grid import Grid
-from Model.TrafficSystem import TrafficSystem, Direction
+from Model.TrafficSystem import TrafficSystem
+from Model.Direction import Direction
 from Model.Coordinate import Coordinate
 from Model.Neighborhood import Neighborhood
+from Model.Scenario import Scenario, MAX_TIME_TO_START
+from Model.ScenarioGenerator import ScenarioGenerator, Seed
+from Model.Solution import to_solution_array
 
-INDUSTRIAL_SIZE = 2
-RESIDENTIAL_SIZE = 2
-MAX_TIME_TO_START = 4
+# Simulation engines: the object engine walks Junction and Car objects, the array engine keeps the same state in
+# NumPy arrays and forwards a tick with vectorized operations.
+OBJECT_ENGINE = 'object'
+ARRAY_ENGINE = 'array'
+
+
+def get_neighborhood_views(state_tensors: ndarray, rows: int, cols: int) -> ndarray:
+    """
+    Return the states of all the rows x cols neighborhoods of one or more city state tensors, see
+    City.get_neighborhood_views.
+    :param state_tensors: An (..., n, m, 4) array of city states.
+    :return: A read only (..., n - rows + 1, m - cols + 1, rows, cols, 4) view.
+    """
+    windows = sliding_window_view(state_tensors, (rows, cols), axis=(-3, -2))
+    return np.moveaxis(windows, -3, -1)
 
 
 class City:
     def __init__(self, n: int, m: int, num_cars: int, residential_coords: List[Coordinate],
-                 industrial_coords: List[Coordinate]):
+                 industrial_coords: List[Coordinate], engine: str = OBJECT_ENGINE, scenario: Scenario = None):
+        """
+        :param scenario: Precomputed cars (departure times and paths) to use instead of drawing num_cars new ones.
+        """
         self.cars: List[Car] = []
+        self.scenario = scenario
         self.time = 0
         self.residential_coords = residential_coords
         self.industrial_coords = industrial_coords
         self.traffic_lights = self.init_traffic_lights(n, m)
         self.grid = self.init_grid(self.traffic_lights)
-        self.init_cars(num_cars)
+        if scenario is None:
+            self.init_cars(num_cars)
+        else:
+            self.init_cars_from_scenario(scenario)
         self.traffic_system = self.init_traffic_system(self.traffic_lights)
         self.n = n
         self.m = m
         self.num_of_active_cars = len(self.cars)
+        self.departures: Dict[int, List[Car]] = self.init_departures()
+        self.cars_at_destination: List[Car] = []
+        self.engine: Optional[ArrayEngine] = None
+        self.set_engine(engine)
+
+    def set_engine(self, engine: str) -> None:
+        """
+        Select the simulation engine of the city. The city is reset to time 0.
+        :param engine: OBJECT_ENGINE or ARRAY_ENGINE.
+        """
+        if engine not in (OBJECT_ENGINE, ARRAY_ENGINE):
+            raise ValueError(f"Unknown simulation engine: {engine}")
+        self.engine = None
+        self.reset_city()
+        if engine == ARRAY_ENGINE:
+            # The snapshots and the neighborhoods of the city need the wait time of its cars at every junction
+            self.engine = ArrayEngine.from_cities([self], keep_wait_history=True)
+
+    def sync_objects(self) -> None:
+        """Copy the array engine state into the Junction and Car objects, if the array engine is used."""
+        if self.engine is None:
+            return
+        self.restore_objects(self.engine.snapshot())
+
+    def snapshot(self) -> CitySnapshot:
+        """Capture the mutable state of the city, it can be brought back with restore."""
+        if self.engine is not None:
+            return self.engine.snapshot()
+        return self.snapshot_objects()
+
+    def restore(self, snapshot: CitySnapshot) -> None:
+        """
+        Bring the city back to a captured state.
+        :param snapshot: A snapshot of this city or of a city built from the same scenario.
+        """
+        if self.engine is not None:
+            self.engine.restore(snapshot)
+            self.time = snapshot.time
+        else:
+            self.restore_objects(snapshot)
+
+    def snapshot_objects(self) -> CitySnapshot:
+        """Capture the state held by the Junction and Car objects."""
+        car_numbers = {car.id: car_num for car_num, car in enumerate(self.cars)}
+        in_grid = np.zeros(len(self.cars), dtype=bool)
+        arrival_ranks = np.zeros(len(self.cars), dtype=np.int32)
+        rank = 0
+        for i, j in self.grid.get_occupied_junctions():
+            # The junction cars dictionary keeps the order the cars entered it
+            for car_id in self.grid.junctions[i][j].cars:
+                in_grid[car_numbers[car_id]] = True
+                arrival_ranks[car_numbers[car_id]] = rank
+                rank += 1
+
+        indices = np.array([car.current_location_index for car in self.cars], dtype=np.int32)
+        arrived = np.array([car.get_did_arrive() for car in self.cars], dtype=bool)
+        visited_counts = ((indices + 1) * (in_grid | arrived)).tolist()
+        wait_times = np.array([self.grid.junctions[coordinate.x][coordinate.y].cars_wait_time[car.id]
+                               for car, count in zip(self.cars, visited_counts) for coordinate in car.path[:count]],
+                              dtype=np.int32)
+        lights = self.grid.lights.copy()
+        return CitySnapshot(self.time, self.num_of_active_cars, self.grid.total_car_movements, lights, indices,
+                            arrived, in_grid, arrival_ranks, wait_times)
+
+    def restore_objects(self, snapshot: CitySnapshot) -> None:
+        """Rebuild the state of the Junction and Car objects from a snapshot."""
+        if snapshot.num_cars != len(self.cars) or snapshot.lights.shape != (self.n, self.m):
+            raise ValueError("Snapshot does not match the city dimensions")
+        np.copyto(self.grid.lights, snapshot.lights)
+
+        self.grid.reset()
+        self.grid.total_car_movements = snapshot.total_car_movements
+        wait_times = iter(snapshot.wait_times.tolist())
+        for car, index, arrived, count in zip(self.cars, snapshot.indices.tolist(), snapshot.arrived.tolist(),
+                                              snapshot.visited_counts().tolist()):
+            car.set_current_location_index(index)
+            car.set_did_arrive(arrived)
+            for coordinate in car.path[:count]:
+                self.grid.junctions[coordinate.x][coordinate.y].cars_wait_time[car.id] = next(wait_times)
+
+        in_grid = np.flatnonzero(snapshot.in_grid)
+        for car_num in in_grid[np.argsort(snapshot.arrival_ranks[in_grid], kind='stable')].tolist():
+            car = self.cars[car_num]
+            self.grid.add_car_to_junction(car, car.current_location)
+
+        self.time = snapshot.time
+        self.num_of_active_cars = snapshot.active_cars
+        self.init_cars_at_destination()
+
+    def init_departures(self) -> Dict[int, List[Car]]:
+        """Bucket the cars by their departure time, keeping their order."""
+        departures = dict()
+        for car in self.cars:
+            departures.setdefault(car.start_time, []).append(car)
+        return departures
+
+    def init_cars_at_destination(self) -> None:
+        """Find the cars that are at their destination but were not removed from the grid yet."""
+        self.cars_at_destination = [car for car in self.cars
+                                    if car.current_location == car.destination and not car.get_did_arrive()]
 
     def init_cars(self, amount: int):
         """Initialize a specified number of cars."""
         self.cars = [self.init_car(i) for i in range(amount)]
 
+    def init_cars_from_scenario(self, scenario: Scenario):
+        """Initialize the cars of a scenario, wrapping its paths with the grid interned coordinates."""
+        coordinates = [coordinate for row in self.grid.coordinates for coordinate in row]
+        self.cars = []
+        for car_num in range(scenario.num_cars):
+            path = [coordinates[junction] for junction in scenario.get_path(car_num).tolist()]
+            self.cars.append(Car(f"Car_{car_num}", path[0], path[-1], int(scenario.start_times[car_num]),
+                                 self.grid.check_highway_direction, path))
+
     def init_car(self, car_num: int) -> Car:
         """Initialize a single car with random source, destination, and departure time."""
         source = self.get_random_location(self.residential_coords)
@@ -51,8 +188,8 @@ class City:
         return coords[index]
 
     def init_traffic_lights(self, n: int, m: int) -> List[List[TrafficLight]]:
-        """Initialize traffic lights for an n x m grid."""
-        return [[TrafficLight() for _ in range(m)] for _ in range(n)]
+        """Initialize traffic lights for an n x m grid, views of the signal plane of the grid and traffic system."""
+        return init_signal_plane(n, m)
 
     def init_grid(self, traffic_lights: List[List[TrafficLight]]) -> Grid:
         """Initialize the city grid."""
@@ -64,24 +201,40 @@ class City:
         return TrafficSystem(traffic_lights)
 
     def get_current_avg_wait_time(self):
+        if self.engine is not None:
+            return self.engine.get_total_avg_wait_time()
         return self.grid.get_total_avg_wait_time()
 
     def update_city(self, assignment: ndarray, debug: bool = False):
         """Forward the city state by one tick of time"""
-        self.traffic_system.update_traffic_lights(assignment)
+        INSTRUMENTATION.count('ticks')
+        if self.engine is not None:
+            if debug:
+                self.print(assignment)
+            with INSTRUMENTATION.phase('engine_update'):
+                self.engine.update(assignment)
+            self.time += 1
+            return
+
+        with INSTRUMENTATION.phase('update_traffic_lights'):
+            self.traffic_system.update_traffic_lights(assignment)
         if debug:
             self.print(assignment)
-        self.remove_cars_from_grid()
-        self.grid.update_grid()
-        self.add_cars_to_grid_by_time()
+        with INSTRUMENTATION.phase('remove_cars_from_grid'):
+            self.remove_cars_from_grid()
+        with INSTRUMENTATION.phase('update_grid'):
+            self.grid.update_grid()
+        with INSTRUMENTATION.phase('add_cars_to_grid_by_time'):
+            self.add_cars_to_grid_by_time()
         self.time += 1
 
-
     def active_cars_amount(self) -> int:
+        if self.engine is not None:
+            return self.engine.active_cars_amount()
         return self.num_of_active_cars
 
     @classmethod
-    def generate_city(cls, n: int, m: int, num_cars: int) -> 'City':
+    def generate_city(cls, n: int, m: int, num_cars: int, engine: str = OBJECT_ENGINE, seed: Seed = None) -> 'City':
         """
         Generates a city with the specified parameters.
         Residential coordinates are a subset of {(0,0), (0,1), (1,0), (1,1)}.
@@ -91,63 +244,126 @@ class City:
         - n (int): Number of rows in the city grid.
         - m (int): Number of columns in the city grid.
         - num_cars (int): Number of cars to generate in the city.
+        - engine (str): The simulation engine of the city.
+        - seed (Seed): The seed of the city, the same (n, m, num_cars, seed) always gives the same city. Fresh entropy
+          by default, the seed used is kept in city.scenario.seed.
 
         Returns:
         - City: A generated City object.
         """
+        return cls.from_scenario(ScenarioGenerator(n, m).generate_scenario(num_cars, seed), engine)
 
-        possible_residential = []
-        for i in range(RESIDENTIAL_SIZE):
-            for j in range(RESIDENTIAL_SIZE):
-                possible_residential.append(Coordinate(0 + i, 0 + j))
-
-        possible_industrial = []
-        for i in range(INDUSTRIAL_SIZE):
-            for j in range(INDUSTRIAL_SIZE):
-                possible_industrial.append(Coordinate(n - 1 - i, m - 1 - j))
-
-        # Ensure at least one residential and one industrial coordinate
-        num_residential = random.randint(1, len(possible_residential))
-        num_industrial = random.randint(1, len(possible_industrial))
-
-        residential_coords = random.sample(possible_residential, num_residential)
-        industrial_coords = random.sample(possible_industrial, num_industrial)
-
-        return cls(n, m, num_cars, residential_coords, industrial_coords)
+    @classmethod
+    def generate_cities(cls, n: int, m: int, num_cars: int, num_cities,
+                        engine: str = OBJECT_ENGINE, seed: Seed = None) -> List['City']:
+        """
+        Generates cities like generate_city. City k is drawn from the k-th child spawned from the seed, see
+        ScenarioGenerator.generate_scenarios.
+        """
+        scenarios = ScenarioGenerator(n, m).generate_scenarios(num_cars, num_cities, seed)
+        return [cls.from_scenario(scenario, engine) for scenario in scenarios]
 
     @classmethod
-    def generate_cities(cls, n: int, m: int, num_cars: int, num_cities) -> List['City']:
-        return [City.generate_city(n, m, num_cars) for _ in range(num_cities)]
+    def from_scenario(cls, scenario: Scenario, engine: str = OBJECT_ENGINE) -> 'City':
+        """Creates a city from a Scenario."""
+        residential_coords = [Coordinate(int(x), int(y)) for x, y in scenario.residential_coords]
+        industrial_coords = [Coordinate(int(x), int(y)) for x, y in scenario.industrial_coords]
+        return cls(scenario.n, scenario.m, scenario.num_cars, residential_coords, industrial_coords, engine, scenario)
+
+    def get_path_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the cars paths packed as junction indices (x * m + y).
+        :return: The (cars + 1) path offsets and the packed paths, car k owning paths[offsets[k]:offsets[k + 1]].
+        """
+        if self.scenario is not None:
+            return self.scenario.path_offsets, self.scenario.paths
+        lengths = [len(car.path) for car in self.cars]
+        paths = np.array([coordinate.x * self.m + coordinate.y for car in self.cars for coordinate in car.path],
+                         dtype=np.int32)
+        return np.concatenate(([0], np.cumsum(lengths))), paths
 
     def add_cars_to_grid_by_time(self):
         """Add all cars that need to depart in the current time to the grid"""
-        for car in self.cars:
-            if car.start_time == self.time:
-                self.grid.add_car_to_junction(car, car.source)
+        for car in self.departures.get(self.time, []):
+            self.grid.add_car_to_junction(car, car.source)
 
     def reset_city(self) -> None:
+        if self.engine is not None:
+            self.engine.reset()
         self.reset_cars()
         self.grid.reset()
         self.time = 0
         self.num_of_active_cars = len(self.cars)
+        self.init_cars_at_destination()
 
     def remove_cars_from_grid(self):
         """Remove all cars that arrived to their destination to the grid"""
-        for car in self.cars:
-            if car.current_location == car.destination and not car.get_did_arrive():
-                self.grid.junctions[car.destination.x][car.destination.y].remove_car(car)
-                self.num_of_active_cars -= 1
+        self.cars_at_destination.extend(self.grid.cars_at_destination)
+        self.grid.cars_at_destination.clear()
+        not_removed = []
+        for car in self.cars_at_destination:
+            self.grid.remove_car_from_junction(car, car.destination)
+            self.num_of_active_cars -= 1
+            if not car.get_did_arrive():
+                not_removed.append(car)
+        self.cars_at_destination = not_removed
+
+    def is_drained(self) -> bool:
+        """Return True if the city state can't change anymore: all the cars departed and left the grid."""
+        if self.engine is not None:
+            return self.engine.is_drained()
+        return self.time > max(self.departures, default=-1) and self.grid.is_empty()
+
+    def fast_forward(self, assignments: ndarray) -> None:
+        """
+        Skip ticks of a drained city, the metrics stay the same as if they were simulated.
+        :param assignments: The assignments of the skipped ticks, only the last one is applied to the traffic lights.
+        """
+        if len(assignments) == 0:
+            return
+        if self.engine is not None:
+            self.engine.fast_forward(assignments)
+        else:
+            self.traffic_system.update_traffic_lights(assignments[-1])
+        self.time += len(assignments)
 
     def reset_cars(self) -> None:
         for car in self.cars:
             car.reset()
 
     def get_total_cars_movements(self):
+        if self.engine is not None:
+            return self.engine.get_total_cars_movements()
         return self.grid.total_car_movements
 
     def get_all_junctions_wait_time(self) -> List[List[Dict[str, int]]]:
+        if self.engine is not None:
+            return self.engine.get_all_junctions_wait_time()
         return self.grid.get_all_junctions_wait_time()
 
+    def get_wait_time_punishment(self) -> float:
+        """Return the sum of the squared wait times of every car at every junction it visited."""
+        if self.engine is not None:
+            return self.engine.get_wait_time_punishments()[0]
+        return self.grid.get_wait_time_punishment()
+
+    def get_state_tensor(self) -> ndarray:
+        """Return the (n, m, 4) state of every junction of the city, see Grid.get_state_tensor."""
+        if self.engine is not None:
+            return self.engine.get_state_tensor()
+        return self.grid.get_state_tensor()
+
+    def get_neighborhood_views(self, rows: int, cols: int) -> ndarray:
+        """
+        Return the states of all the rows x cols neighborhoods of the city as a view of the city state tensor,
+        without building Neighborhood objects.
+        :param rows: The number of rows of a neighborhood.
+        :param cols: The number of columns of a neighborhood.
+        :return: A read only (n - rows + 1, m - cols + 1, rows, cols, 4) array, the [i, j] entry is the state of
+            the neighborhood whose top left corner is (i, j), laid out like Neighborhood.get_state.
+        """
+        return get_neighborhood_views(self.get_state_tensor(), rows, cols)
+
     def get_neighborhood(self, top_left: Coordinate, top_right: Coordinate, bottom_left: Coordinate) -> Neighborhood:
         """
         Creates a Neighborhood by the given borders and copies all the relevant city data into it.
@@ -156,9 +372,11 @@ class City:
         :param bottom_left: The bottom left coordinate border.
         :return: A Neighborhood
         """
+        INSTRUMENTATION.count('neighborhoods_built')
+        self.sync_objects()
         rows = bottom_left.x - top_left.x + 1
         cols = top_right.y - top_left.y + 1
-        copy_traffic_lights = [[TrafficLight() for _ in range(cols)] for _ in range(rows)]
+        copy_traffic_lights = init_signal_plane(rows, cols)
         horizontal_highway_junctions, vertical_highway_junctions = self.get_highway_coordinates(bottom_left,
                                                                                                 copy_traffic_lights,
                                                                                                 top_left, top_right)
@@ -215,6 +433,8 @@ class City:
 
     def print(self, assignment: ndarray):
         """Print a visual representation of the City."""
+        self.sync_objects()
+        assignment = to_solution_array(assignment)
         print("-----------------------------------------------------------------------------")
         print("City layout:")
         # ANSI color codes
@@ -227,12 +447,9 @@ class City:
         for i in range(self.n):
             # Print junctions and horizontal connections
             for j in range(self.m):
-                junction = self.grid.junctions[i][j]
-                light_direction = 'V' if assignment[i, j] == Direction.VERTICAL else 'H'
-                vertical_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.VERTICAL)
-                horizontal_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.HORIZONTAL)
+                light_direction = 'V' if assignment[i, j] == Direction.VERTICAL.value else 'H'
+                vertical_cars = self.grid.queue_counts[i, j, Direction.VERTICAL.value]
+                horizontal_cars = self.grid.queue_counts[i, j, Direction.HORIZONTAL.value]
 
                 # Color the direction only if there are cars in the junction
                 total_cars = vertical_cars + horizontal_cars
@@ -0,0 +1,91 @@
+import numpy as np
+
+# Version of the to_bytes layout, bumped whenever the layout changes.
+SNAPSHOT_FORMAT_VERSION = 1
+# Header fields: format version, n, m, cars, packed wait times, time, active cars and total car movements.
+HEADER_SIZE = 8
+
+
+class CitySnapshot:
+    """
+    The full mutable state of a simulated city, in a handful of flat NumPy arrays.
+    The static data (grid layout, cars paths and departure times) is not part of the snapshot, it belongs to the
+    city the snapshot is restored into. A car that departed visited the junctions path[0..indices[k]], and its wait
+    time at each of them is packed in wait_times, car after car.
+    """
+
+    def __init__(self, time: int, active_cars: int, total_car_movements: int, lights: np.ndarray,
+                 indices: np.ndarray, arrived: np.ndarray, in_grid: np.ndarray, arrival_ranks: np.ndarray,
+                 wait_times: np.ndarray):
+        """
+        :param time: The city time.
+        :param active_cars: The number of cars that did not reach their destination.
+        :param total_car_movements: The number of moves made by all the cars.
+        :param lights: An (n, m) uint8 array of the traffic light directions.
+        :param indices: The current path index of every car.
+        :param arrived: Whether every car arrived and left the grid.
+        :param in_grid: Whether every car is in a junction.
+        :param arrival_ranks: The order in which the cars in the grid entered their junction, lower ranks first.
+        :param wait_times: The wait times of the departed cars at every junction they visited, packed car after car.
+        """
+        self.time = time
+        self.active_cars = active_cars
+        self.total_car_movements = total_car_movements
+        self.lights = lights
+        self.indices = indices
+        self.arrived = arrived
+        self.in_grid = in_grid
+        self.arrival_ranks = arrival_ranks
+        self.wait_times = wait_times
+
+    @property
+    def num_cars(self) -> int:
+        return len(self.indices)
+
+    def visited_counts(self) -> np.ndarray:
+        """Return the number of junctions each car visited, the length of its entry in wait_times."""
+        departed = self.in_grid | self.arrived
+        return (self.indices + 1) * departed
+
+    def to_bytes(self) -> bytes:
+        """Serialize the snapshot, see from_bytes."""
+        n, m = self.lights.shape
+        header = np.array([SNAPSHOT_FORMAT_VERSION, n, m, self.num_cars, len(self.wait_times), self.time,
+                           self.active_cars, self.total_car_movements], dtype='<i8')
+        return b''.join((header.tobytes(),
+                         self.lights.astype(np.uint8).tobytes(),
+                         self.indices.astype('<i4').tobytes(),
+                         np.packbits(self.arrived).tobytes(),
+                         np.packbits(self.in_grid).tobytes(),
+                         self.arrival_ranks.astype('<i4').tobytes(),
+                         self.wait_times.astype('<i4').tobytes()))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CitySnapshot':
+        """
+        Deserialize a snapshot written by to_bytes.
+        :param data: The serialized snapshot.
+        :return: A CitySnapshot, its arrays are read only views of data.
+        """
+        header = np.frombuffer(data, dtype='<i8', count=HEADER_SIZE)
+        version, n, m, num_cars, num_wait_times, time, active_cars, total_car_movements = header.tolist()
+        if version != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version: {version}")
+
+        offset = header.nbytes
+        lights = np.frombuffer(data, dtype=np.uint8, count=n * m, offset=offset).reshape(n, m)
+        offset += lights.nbytes
+        indices = np.frombuffer(data, dtype='<i4', count=num_cars, offset=offset)
+        offset += indices.nbytes
+        packed_size = -(-num_cars // 8)
+        arrived = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=packed_size, offset=offset),
+                                count=num_cars).astype(bool)
+        offset += packed_size
+        in_grid = np.unpackbits(np.frombuffer(data, dtype=np.uint8, count=packed_size, offset=offset),
+                                count=num_cars).astype(bool)
+        offset += packed_size
+        arrival_ranks = np.frombuffer(data, dtype='<i4', count=num_cars, offset=offset)
+        offset += arrival_ranks.nbytes
+        wait_times = np.frombuffer(data, dtype='<i4', count=num_wait_times, offset=offset)
+        return cls(time, active_cars, total_car_movements, lights, indices, arrived, in_grid, arrival_ranks,
+                   wait_times)
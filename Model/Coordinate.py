@@ -1,10 +1,26 @@
 class Coordinate:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x: int, y: int):
-        self.x = x
-        self.y = y
+        object.__setattr__(self, 'x', x)
+        object.__setattr__(self, 'y', y)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Coordinate is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Coordinate is immutable")
 
     def __eq__(self, other):
-        if self.x == other.x and self.y == other.y:
-            return True
-        else:
-            return False
+        if not isinstance(other, Coordinate):
+            return NotImplemented
+        return self.x == other.x and self.y == other.y
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    def __repr__(self):
+        return f"Coordinate({self.x}, {self.y})"
+
+    def __reduce__(self):
+        return Coordinate, (self.x, self.y)
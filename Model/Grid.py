@@ -1,13 +1,22 @@
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple, Optional
+import numpy as np
 from Model.Coordinate import Coordinate
 from Model.Junction import Junction
-from Model.TrafficLight import TrafficLight, Direction
+from Model.TrafficLight import TrafficLight, Direction, get_signal_plane
 from Model.Car import Car
+from Model.Instrumentation import INSTRUMENTATION
 
 START_HIGH_WAY = 2
 END_REFERENCE_HIGHWAY = 3
 GAP_HIGH_WAY = 4
 
+# The highway directions a junction allows, shared by all the cells of the lookup table
+VERTICAL_HIGHWAY_DIRECTIONS = [Direction.VERTICAL]
+HORIZONTAL_HIGHWAY_DIRECTIONS = [Direction.HORIZONTAL]
+ALL_DIRECTIONS = [Direction.VERTICAL, Direction.HORIZONTAL]
+# The Direction of every light state value
+LIGHT_DIRECTIONS = [Direction.HORIZONTAL, Direction.VERTICAL]
+
 
 class Grid:
     def __init__(self, traffic_lights: List[List[TrafficLight]],
@@ -25,8 +34,24 @@ class Grid:
         else:
             self.horizontal_highway_junctions: List[Coordinate] = (self.init_horizontal_highway_junctions(
                 [START_HIGH_WAY, self.n - END_REFERENCE_HIGHWAY], self.m - GAP_HIGH_WAY))
+        self.coordinates: List[List[Coordinate]] = [[Coordinate(i, j) for j in range(self.m)] for i in range(self.n)]
+        self.is_vertical_highway: np.ndarray = self.init_highway_map(self.vertical_highway_junctions)
+        self.is_horizontal_highway: np.ndarray = self.init_highway_map(self.horizontal_highway_junctions)
+        self.highway_directions: List[List[List[Direction]]] = self.init_highway_directions()
         self.junctions: List[List[Junction]] = self.init_junctions(traffic_lights)
+        # The (n, m) light states of the junctions, None when the traffic lights are not views of one signal plane
+        self.lights: Optional[np.ndarray] = get_signal_plane(traffic_lights)
         self.total_car_movements = 0
+        # Junctions that may hold cars, empty ones are dropped lazily by get_occupied_junctions
+        self.occupied_junctions: Set[Tuple[int, int]] = set()
+        # Cars that moved into their destination and are waiting to be removed by the City
+        self.cars_at_destination: List[Car] = []
+        # The number of cars in every junction by the direction they wait to go, indexed by Direction value
+        self.queue_counts: np.ndarray = np.zeros((self.n, self.m, len(Direction)), dtype=int)
+        # Incremented whenever a car enters or leaves a junction, so observations of the grid can be cached
+        self.state_version = 0
+        self.state_tensor: Optional[np.ndarray] = None
+        self.state_tensor_version = -1
 
     @classmethod
     def copy(cls, other: 'Grid', traffic_lights: List[List[TrafficLight]]) -> 'Grid':
@@ -51,39 +76,77 @@ class Grid:
             [
                 Junction(
                     traffic_lights[i][j],
-                    Coordinate(i, j) in self.horizontal_highway_junctions,
-                    Coordinate(i, j) in self.vertical_highway_junctions
+                    bool(self.is_horizontal_highway[i, j]),
+                    bool(self.is_vertical_highway[i, j])
                 )
                 for j in range(self.m)
             ]
             for i in range(self.n)
         ]
 
+    def init_highway_map(self, highway_junctions: List[Coordinate]) -> np.ndarray:
+        """
+        Build an (n, m) boolean map of the given highway junctions, ignoring the ones outside the grid.
+        :param highway_junctions: The highway junctions coordinates.
+        :return: The highway map.
+        """
+        highway_map = np.zeros((self.n, self.m), dtype=bool)
+        for coordinate in highway_junctions:
+            if not self.out_of_grid(coordinate) and coordinate.x >= 0 and coordinate.y >= 0:
+                highway_map[coordinate.x, coordinate.y] = True
+        return highway_map
+
+    def init_highway_directions(self) -> List[List[List[Direction]]]:
+        """Precompute the result of check_highway_direction for every junction."""
+        directions = []
+        for i in range(self.n):
+            row = []
+            for j in range(self.m):
+                if self.is_vertical_highway[i, j] and not self.is_horizontal_highway[i, j]:
+                    row.append(VERTICAL_HIGHWAY_DIRECTIONS)
+                elif self.is_horizontal_highway[i, j] and not self.is_vertical_highway[i, j]:
+                    row.append(HORIZONTAL_HIGHWAY_DIRECTIONS)
+                else:
+                    row.append(ALL_DIRECTIONS)
+            directions.append(row)
+        return directions
+
+    def coordinate(self, x: int, y: int) -> Coordinate:
+        """Return the interned Coordinate of a junction in the grid."""
+        return self.coordinates[x][y]
+
     def reset(self) -> None:
         for junctions in self.junctions:
             for junction in junctions:
                 junction.reset()
         self.total_car_movements = 0
+        self.occupied_junctions.clear()
+        self.cars_at_destination.clear()
+        self.queue_counts.fill(0)
+        self.state_version += 1
 
     def update_grid(self) -> None:
         """Update the state of all junctions in the grid and move cars."""
         cars_to_move = self.get_cars_to_move()
+        INSTRUMENTATION.count('cars_moved', len(cars_to_move))
         # Now move the cars
         for car, old_coordinate, new_coordinate in cars_to_move:
-            self.junctions[old_coordinate.x][old_coordinate.y].remove_car(car)
-            self.junctions[new_coordinate.x][new_coordinate.y].add_car(car)
+            self.remove_car_from_junction(car, old_coordinate)
             car.update_current_location()
+            self.add_car_to_junction(car, new_coordinate)
+            if car.current_location == car.destination:
+                self.cars_at_destination.append(car)
 
     def update_sub_grid(self) -> None:
         """Update the state of all junctions in the sub-grid of an neighborhood and move cars."""
         cars_to_move = self.get_cars_to_move()
         for car, old_coordinate, new_coordinate in cars_to_move:
-            self.junctions[old_coordinate.x][old_coordinate.y].remove_car(car)
+            self.remove_car_from_junction(car, old_coordinate)
+            car.update_current_location()
             if self.out_of_grid(new_coordinate):
                 pass
             else:
-                self.junctions[new_coordinate.x][new_coordinate.y].add_car(car)
-            car.update_current_location()
+                self.add_car_to_junction(car, new_coordinate)
 
     def out_of_grid(self, coordinate: Coordinate) -> bool:
         """
@@ -99,23 +162,60 @@ class Grid:
         """Return a list of all the cars that will move in the next tick ot time and where they
         will move"""
         cars_to_move = []
-        # First, update all junctions and collect cars that need to be moved
-        for i in range(self.n):
-            for j in range(self.m):
-                junction = self.junctions[i][j]
-                direction, moving_cars = junction.resolve_moving_cars()
-                self.total_car_movements += len(moving_cars)
-
-                for car in moving_cars:
-                    if direction == Direction.VERTICAL and i < self.n:
-                        cars_to_move.append((car, Coordinate(i, j), Coordinate(i + 1, j)))  # Move Up
-                    elif direction == Direction.HORIZONTAL and j < self.m:
-                        cars_to_move.append((car, Coordinate(i, j), Coordinate(i, j + 1)))  # Move Right
+        # First, update all junctions and collect cars that need to be moved. Empty junctions don't change, so only
+        # the occupied ones are visited, in the same row major order.
+        occupied_junctions = self.get_occupied_junctions()
+        INSTRUMENTATION.count('junctions_visited', len(occupied_junctions))
+        # Read the whole signal plane at once, the junctions get their direction by index
+        lights = self.lights.tolist() if self.lights is not None else None
+        for i, j in occupied_junctions:
+            junction = self.junctions[i][j]
+            light = LIGHT_DIRECTIONS[lights[i][j]] if lights is not None else None
+            direction, moving_cars = junction.resolve_moving_cars(light)
+            self.total_car_movements += len(moving_cars)
+
+            if not moving_cars:
+                continue
+            current = self.coordinates[i][j]
+            if direction == Direction.VERTICAL:
+                target = self.coordinates[i + 1][j] if i + 1 < self.n else Coordinate(i + 1, j)  # Move Up
+            else:
+                target = self.coordinates[i][j + 1] if j + 1 < self.m else Coordinate(i, j + 1)  # Move Right
+            for car in moving_cars:
+                cars_to_move.append((car, current, target))
         return cars_to_move
 
+    def get_occupied_junctions(self) -> List[Tuple[int, int]]:
+        """Return the (i, j) of all the junctions that hold cars, in row major order."""
+        self.occupied_junctions = {(i, j) for i, j in self.occupied_junctions if self.junctions[i][j].cars}
+        return sorted(self.occupied_junctions)
+
+    def is_empty(self) -> bool:
+        """Return True if there are no cars in the grid."""
+        return not self.get_occupied_junctions()
+
+    def get_state_tensor(self) -> np.ndarray:
+        """
+        Return an (n, m, 4) array with, for every junction, the number of cars waiting to go vertical and
+        horizontal, and whether it is a vertical and a horizontal highway.
+        The array is rebuilt only when cars entered or left a junction since the last call, it must not be modified.
+        """
+        if self.state_tensor_version != self.state_version:
+            self.state_tensor = np.stack((self.queue_counts[:, :, Direction.VERTICAL.value],
+                                          self.queue_counts[:, :, Direction.HORIZONTAL.value],
+                                          self.is_vertical_highway,
+                                          self.is_horizontal_highway), axis=-1).astype(int)
+            self.state_tensor_version = self.state_version
+        return self.state_tensor
+
     def get_all_junctions_wait_time(self) -> List[List[Dict[str, int]]]:
         return [[junction.get_cars_wait_time() for junction in junctions] for junctions in self.junctions]
 
+    def get_wait_time_punishment(self) -> int:
+        """Return the sum of the squared wait times of every car at every junction it visited."""
+        return sum(wait_time ** 2 for junction_wait_times in self.get_all_junctions_wait_time()
+                   for wait_times in junction_wait_times for wait_time in wait_times.values())
+
     def get_total_avg_wait_time(self) -> float:
         """Calculate the average wait time across all unique cars in all junctions."""
         all_junctions_avg_wait_time = sum([sum([junction.get_avg_wait_time() for junction in junctions]) for junctions in
@@ -125,10 +225,26 @@ class Grid:
     def add_car_to_junction(self, car: Car, coordinate: Coordinate) -> None:
         """Add a car to a specific junction."""
         if 0 <= coordinate.x < self.n and 0 <= coordinate.y < self.m:
-            self.junctions[coordinate.x][coordinate.y].add_car(car)
+            junction = self.junctions[coordinate.x][coordinate.y]
+            if car.id not in junction.cars:
+                self.queue_counts[coordinate.x, coordinate.y, car.current_direction().value] += 1
+                self.state_version += 1
+            junction.add_car(car)
+            self.occupied_junctions.add((coordinate.x, coordinate.y))
         else:
             print(f"Invalid junction coordinates: ({coordinate.x}, {coordinate.y})")
 
+    def remove_car_from_junction(self, car: Car, coordinate: Coordinate) -> None:
+        """
+        Remove a car from a specific junction, if it is there.
+        The car must still have the path index it entered the junction with, so its direction is counted out.
+        """
+        junction = self.junctions[coordinate.x][coordinate.y]
+        if car.id in junction.cars:
+            self.queue_counts[coordinate.x, coordinate.y, car.current_direction().value] -= 1
+            self.state_version += 1
+        junction.remove_car(car)
+
     def init_vertical_highway_junctions(self, vertical_highways: List[int], width: int = 1) -> List[Coordinate]:
         """
         Initialize vertical highways by specifying which columns should have vertical highways.
@@ -159,10 +275,6 @@ class Grid:
 
     def check_highway_direction(self, coordinate: Coordinate) -> List[Direction]:
         """If coordinate is on a highway, return the highway preferred direction"""
-        if coordinate in self.vertical_highway_junctions:
-            if coordinate in self.horizontal_highway_junctions:
-                return [Direction.VERTICAL, Direction.HORIZONTAL]
-            return [Direction.VERTICAL]
-        if coordinate in self.horizontal_highway_junctions:
-            return [Direction.HORIZONTAL]
-        return [Direction.VERTICAL, Direction.HORIZONTAL]
+        if 0 <= coordinate.x < self.n and 0 <= coordinate.y < self.m:
+            return self.highway_directions[coordinate.x][coordinate.y]
+        return ALL_DIRECTIONS
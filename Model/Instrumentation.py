@@ -0,0 +1,95 @@
+import time
+from collections import defaultdict
+from typing import Dict
+
+
+class PhaseTimer:
+    """Adds the time spent in a with block to a phase of an Instrumentation."""
+
+    def __init__(self, instrumentation: 'Instrumentation', name: str):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.times[self.name] += time.perf_counter() - self.start
+        self.instrumentation.calls[self.name] += 1
+        return False
+
+
+class NullTimer:
+    """The timer of a disabled Instrumentation, a with block on it does nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Instrumentation:
+    """
+    Opt-in per-phase timers and counters.
+    Code wraps its phases with `with INSTRUMENTATION.phase(name):` and counts events with
+    `INSTRUMENTATION.count(name, amount)`. While disabled, phase returns a shared do-nothing timer and count returns
+    right away, so the instrumented code only pays a method call. Phases may be nested, each one is timed on its own.
+    Only the current process is measured, the work of worker processes is not included.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.times: Dict[str, float] = defaultdict(float)
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        """Clear the collected times and counters."""
+        self.times.clear()
+        self.calls.clear()
+        self.counters.clear()
+
+    def phase(self, name: str):
+        """Return a context manager timing a phase."""
+        if not self.enabled:
+            return NULL_TIMER
+        return PhaseTimer(self, name)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        """Add to a counter."""
+        if self.enabled:
+            self.counters[name] += amount
+
+    def summary(self) -> str:
+        """Return a table of the phases, slowest first, and of the counters."""
+        lines = [f"{'phase':<32} {'calls':>10} {'total (s)':>12} {'per call (ms)':>14}"]
+        for name, total in sorted(self.times.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f"{name:<32} {calls:>10} {total:>12.4f} {total / calls * 1e3:>14.4f}")
+        if self.counters:
+            lines.append(f"{'counter':<32} {'amount':>10}")
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f"{name:<32} {amount:>10}")
+        return '\n'.join(lines)
+
+    def report(self, title: str) -> None:
+        """Print the summary if enabled, e.g. at the end of a solver run."""
+        if self.enabled:
+            print(f"--- {title} ---")
+            print(self.summary())
+
+
+# The instrumentation shared by the simulation and the solvers
+INSTRUMENTATION = Instrumentation()
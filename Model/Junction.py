@@ -38,12 +38,15 @@ class Junction:
             if car.current_location == car.destination:
                 car.set_did_arrive(True)
 
-    def resolve_moving_cars(self) -> Tuple[Direction, List[Car]]:
+    def resolve_moving_cars(self, current_direction: Direction = None) -> Tuple[Direction, List[Car]]:
         """
         Update the junction state and return the current traffic light direction
         and the list of cars that can move.
+        :param current_direction: The light direction, read from the grid signal plane. The junction traffic light
+            is read when it is not given.
         """
-        current_direction = self.traffic_light.get_current_direction()
+        if current_direction is None:
+            current_direction = self.traffic_light.get_current_direction()
         cars_in_current_direction = [car for car in self.cars.values() if car.current_direction() == current_direction]
 
         cars_in_current_direction.sort(key=lambda car: self.cars_wait_time[car.id], reverse=True)
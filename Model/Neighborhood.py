@@ -1,11 +1,13 @@
 import numpy as np
-from typing import List
+from typing import List, Optional
 from numpy import ndarray
 from Model.Car import Car
-from Model.TrafficLight import TrafficLight
+from Model.TrafficLight import init_signal_plane
 from Model.Grid import Grid
-from Model.TrafficSystem import TrafficSystem, Direction
+from Model.TrafficSystem import TrafficSystem
+from Model.Direction import Direction
 from Model.Coordinate import Coordinate
+from Model.Solution import to_solution_array
 
 
 class Neighborhood:
@@ -20,6 +22,9 @@ class Neighborhood:
         self.shift_y = shift_y
         self.n = len(self.grid.junctions)
         self.m = len(self.grid.junctions[0])
+        # The last state returned by get_state and the grid version it was built from
+        self.state: Optional[ndarray] = None
+        self.state_version = -1
 
     @classmethod
     def deep_copy(cls, other: 'Neighborhood') -> 'Neighborhood':
@@ -29,7 +34,7 @@ class Neighborhood:
         :return: The copied Neighborhood.
         """
         copy_cars = [Car.copy_constructor(car) for car in other.cars]
-        copy_traffic_lights = [[TrafficLight() for _ in range(other.m)] for _ in range(other.n)]
+        copy_traffic_lights = init_signal_plane(other.n, other.m)
         copy_grid = Grid.copy(other.grid, copy_traffic_lights)  # with wait times
         copy_traffic_system = TrafficSystem(copy_traffic_lights)
         for car in copy_cars:
@@ -47,26 +52,16 @@ class Neighborhood:
         )
 
     def get_state(self) -> ndarray:
-        """Return the current state of the Neighborhood."""
-        rows = len(self.grid.junctions)
-        cols = len(self.grid.junctions[0])
-
-        state = np.zeros((rows, cols, 4), dtype=int)
-        for i, junctions in enumerate(self.grid.junctions):
-            for j, junction in enumerate(junctions):
-                is_vertical = 0
-                is_horizontal = 0
-                if junction.get_is_vertical_highway():
-                    is_vertical = 1
-                if junction.get_is_horizontal_highway():
-                    is_horizontal = 1
-                vertical_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.VERTICAL)
-                horizontal_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.HORIZONTAL)
-
-                state[i, j] = [vertical_cars, horizontal_cars, is_vertical, is_horizontal]
-        return state.flatten()
+        """
+        Return the current state of the Neighborhood: for every junction the number of cars waiting to go
+        vertical and horizontal, and whether it is a vertical and a horizontal highway.
+        The state is rebuilt only when cars entered or left a junction since the last call, the returned array
+        must not be modified.
+        """
+        if self.state_version != self.grid.state_version:
+            self.state = self.grid.get_state_tensor().flatten()
+            self.state_version = self.grid.state_version
+        return self.state
 
     def update_neighborhood(self, assignment: np.ndarray) -> None:
         """Forward the neighborhood state by one tick of time"""
@@ -79,7 +74,7 @@ class Neighborhood:
             if self.grid.out_of_grid(car.current_location) and not car.get_did_arrive():
                 car.set_did_arrive(True)
             elif car.current_location == car.destination and not car.get_did_arrive():
-                self.grid.junctions[car.destination.x][car.destination.y].remove_car(car)
+                self.grid.remove_car_from_junction(car, car.destination)
 
     def active_cars_amount(self) -> int:
         amount = 0
@@ -91,6 +86,7 @@ class Neighborhood:
 
     def print(self, assignment: ndarray):
         """Print a visual representation of the City."""
+        assignment = to_solution_array(assignment)
         print("-----------------------------------------------------------------------------")
         print("Neighborhood layout:")
         # ANSI color codes
@@ -101,12 +97,9 @@ class Neighborhood:
         for i in range(self.n):
             # Print junctions and horizontal connections
             for j in range(self.m):
-                junction = self.grid.junctions[i][j]
-                light_direction = 'V' if assignment[i, j] == Direction.VERTICAL else 'H'
-                vertical_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.VERTICAL)
-                horizontal_cars = sum(
-                    1 for car in junction.cars.values() if car.current_direction() == Direction.HORIZONTAL)
+                light_direction = 'V' if assignment[i, j] == Direction.VERTICAL.value else 'H'
+                vertical_cars = self.grid.queue_counts[i, j, Direction.VERTICAL.value]
+                horizontal_cars = self.grid.queue_counts[i, j, Direction.HORIZONTAL.value]
 
                 # Color the direction only if there are cars in the junction
                 total_cars = vertical_cars + horizontal_cars
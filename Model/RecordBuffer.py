@@ -0,0 +1,101 @@
+import os
+from typing import List, Optional
+import numpy as np
+
+# The number of records in a chunk of a RecordBuffer.
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class RecordBuffer:
+    """
+    A growable column of structured records, stored in fixed size chunks.
+    Appending writes into the last chunk and allocates a new one when it fills, so a record costs O(1) instead of
+    copying the whole history. When spill_threshold is set, full chunks beyond it are saved to spill_directory and
+    dropped from memory, and they are loaded back only when the whole history is read. The history is read once per
+    change: to_array caches the concatenated records until the next append.
+    """
+
+    def __init__(self, name: str, dtype: np.dtype, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 spill_threshold: Optional[int] = None, spill_directory: Optional[str] = None):
+        """
+        :param name: The name of the record type, used for the spill file names.
+        :param dtype: The structured dtype of a record.
+        :param chunk_size: The number of records in a chunk.
+        :param spill_threshold: The maximum number of records kept in memory, None to keep all of them.
+        :param spill_directory: The directory the spilled chunks are saved in, required with spill_threshold.
+        """
+        if spill_threshold is not None and spill_directory is None:
+            raise ValueError("A spill directory is required to spill records")
+        self.name = name
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.spill_threshold = spill_threshold
+        self.spill_directory = spill_directory
+        self.spilled_files: List[str] = []
+        self.spilled_records = 0
+        self.chunks: List[np.ndarray] = []
+        self.fill = chunk_size
+        # The records returned by the last to_array, None once a record was added since
+        self.cached_array: Optional[np.ndarray] = None
+
+    def __getstate__(self):
+        # The cached records are rebuilt on demand, a copy sent to another process doesn't carry them twice
+        state = self.__dict__.copy()
+        state['cached_array'] = None
+        return state
+
+    def __len__(self) -> int:
+        return self.spilled_records + len(self.chunks) * self.chunk_size - (self.chunk_size - self.fill)
+
+    def append(self, *values) -> None:
+        """Append a single record, given by its field values."""
+        self.cached_array = None
+        if self.fill == self.chunk_size:
+            self.add_chunk()
+        self.chunks[-1][self.fill] = values
+        self.fill += 1
+
+    def extend(self, records: np.ndarray) -> None:
+        """Append an array of records of the same dtype."""
+        if len(records) > 0:
+            self.cached_array = None
+        start = 0
+        while start < len(records):
+            if self.fill == self.chunk_size:
+                self.add_chunk()
+            amount = min(self.chunk_size - self.fill, len(records) - start)
+            self.chunks[-1][self.fill:self.fill + amount] = records[start:start + amount]
+            self.fill += amount
+            start += amount
+
+    def add_chunk(self) -> None:
+        """Start a new chunk, spilling the full ones first if there are too many records in memory."""
+        if self.spill_threshold is not None and len(self.chunks) * self.chunk_size >= self.spill_threshold:
+            self.spill()
+        self.chunks.append(np.empty(self.chunk_size, dtype=self.dtype))
+        self.fill = 0
+
+    def spill(self) -> None:
+        """Save all the full chunks to the spill directory and drop them from memory."""
+        os.makedirs(self.spill_directory, exist_ok=True)
+        for chunk in self.chunks:
+            path = os.path.join(self.spill_directory, f'{self.name}_{len(self.spilled_files)}.npy')
+            np.save(path, chunk, allow_pickle=True)
+            self.spilled_files.append(path)
+            self.spilled_records += len(chunk)
+        self.chunks = []
+        self.fill = self.chunk_size
+
+    def to_array(self) -> np.ndarray:
+        """
+        Return all the records, including the spilled ones, as one structured array.
+        The array is shared by the calls until the next append, so it is read only.
+        """
+        if self.cached_array is None:
+            parts = [np.load(path, allow_pickle=True) for path in self.spilled_files]
+            if self.chunks:
+                parts.extend(self.chunks[:-1])
+                parts.append(self.chunks[-1][:self.fill])
+            self.cached_array = np.concatenate(parts) if parts else np.empty((0,), dtype=self.dtype)
+            self.cached_array.flags.writeable = False
+        return self.cached_array
@@ -1,67 +1,106 @@
-import random
+import tempfile
+from typing import Optional
 
 import numpy as np
 
+from Model.RecordBuffer import RecordBuffer, DEFAULT_CHUNK_SIZE
+from Model.RunLog import RunLog
+from Model.Solution import to_solution_array
+
+# The record types of a Reporter: their attribute names and structured dtypes.
+RECORD_TYPES = {
+    'wait_times': [('avg_wait_time', float)],
+    'all_cars_arrive_time': [('time', float)],
+    'not_reaching_cars': [('cars_num', float)],
+    'moving_cars_amount': [('active_car', float)],
+    'wait_time_punishment': [('wait_punishment', float)],
+    'best_solutions': [('fitness', float), ('solution', object)],
+}
+
 
 class Reporter:
-    def __init__(self):
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE, spill_threshold: Optional[int] = None,
+                 spill_directory: Optional[str] = None, log_directory: Optional[str] = None):
+        """
+        The records are kept in chunked buffers, see RecordBuffer.
+        :param chunk_size: The number of records in a chunk.
+        :param spill_threshold: The maximum number of records of a type kept in memory, the older chunks are saved
+            to disk. None keeps all the records in memory.
+        :param spill_directory: The directory the spilled chunks are saved in. By default a temporary directory,
+            removed by close.
+        :param log_directory: If given, every record is also appended to a RunLog in this directory (the fitness
+            for best_solutions), so the run can be followed while it goes on.
+        """
+        self.run_log = RunLog(log_directory) if log_directory is not None else None
+        # The temporary spill directory, also removed when the reporter is garbage collected or the program exits
+        self.temporary_directory: Optional[tempfile.TemporaryDirectory] = None
+        if spill_threshold is not None and spill_directory is None:
+            self.temporary_directory = tempfile.TemporaryDirectory(prefix='reporter_')
+            spill_directory = self.temporary_directory.name
         # Initialize separate data structures for each record type
+        self.buffers = {name: RecordBuffer(name, dtype, chunk_size, spill_threshold, spill_directory)
+                        for name, dtype in RECORD_TYPES.items()}
+
+    def __getstate__(self):
+        # A copy reads the spilled chunks of this reporter, only this reporter removes them
+        state = self.__dict__.copy()
+        state['temporary_directory'] = None
+        return state
 
-        self.wait_times = np.empty((0,), dtype=[
-            ('avg_wait_time', float)
-        ])
+    @property
+    def wait_times(self) -> np.ndarray:
+        return self.buffers['wait_times'].to_array()
 
-        self.all_cars_arrive_time = np.empty((0,), dtype=[
-            ('time', float)
-        ])
+    @property
+    def all_cars_arrive_time(self) -> np.ndarray:
+        return self.buffers['all_cars_arrive_time'].to_array()
 
-        self.not_reaching_cars = np.empty((0,), dtype=[
-            ('cars_num', float)
-        ])
+    @property
+    def not_reaching_cars(self) -> np.ndarray:
+        return self.buffers['not_reaching_cars'].to_array()
 
-        self.moving_cars_amount = np.empty((0,), dtype=[
-            ('active_car', float)
-        ])
+    @property
+    def moving_cars_amount(self) -> np.ndarray:
+        return self.buffers['moving_cars_amount'].to_array()
 
-        self.wait_time_punishment = np.empty((0,), dtype=[
-            ('wait_punishment', float)
-        ])
+    @property
+    def wait_time_punishment(self) -> np.ndarray:
+        return self.buffers['wait_time_punishment'].to_array()
 
-        self.best_solutions = np.empty((0,), dtype=[
-            ('fitness', float),
-            ('solution', object)
-        ])
+    @property
+    def best_solutions(self) -> np.ndarray:
+        return self.buffers['best_solutions'].to_array()
+
+    def record(self, name: str, *values):
+        """Append a record to the buffer of its type, and its first field to the run log."""
+        self.buffers[name].append(*values)
+        if self.run_log is not None:
+            self.run_log.append(name, values[0])
 
     def record_not_reaching_cars(self, cars_num):
-        record = np.array([(
-            cars_num
-        )], dtype=self.not_reaching_cars.dtype)
-        self.not_reaching_cars = np.append(self.not_reaching_cars, record)
+        self.record('not_reaching_cars', cars_num)
 
     def record_wait_punishment(self, wait_punishment):
-        record = np.array([(
-            wait_punishment
-        )], dtype=self.wait_time_punishment.dtype)
-        self.wait_time_punishment = np.append(self.wait_time_punishment, record)
+        self.record('wait_time_punishment', wait_punishment)
 
     def record_moving_cars(self, active_cars):
-        record = np.array([(
-            active_cars
-        )], dtype=self.moving_cars_amount.dtype)
-        self.moving_cars_amount = np.append(self.moving_cars_amount, record)
+        self.record('moving_cars_amount', active_cars)
 
     def record_avg_wait_time(self, avg_wait_time: float):
-        record = np.array([(
-            avg_wait_time
-        )], dtype=self.wait_times.dtype)
-        self.wait_times = np.append(self.wait_times, record)
+        self.record('wait_times', avg_wait_time)
 
     def record_best_solutions_scores(self, fitness: float, solution: np.ndarray):
-        record = np.array([(
-            fitness,
-            solution
-        )], dtype=self.best_solutions.dtype)
-        self.best_solutions = np.append(self.best_solutions, record)
+        # Solutions are kept as their uint8 Direction values, a byte per light instead of an object pointer. The copy
+        # doesn't keep alive the population the solution may be a view of.
+        self.record('best_solutions', fitness, to_solution_array(solution).copy())
+
+    def merge(self, other: 'Reporter'):
+        """Append all the records of another reporter, e.g. one filled by a worker process."""
+        for name, buffer in self.buffers.items():
+            records = other.buffers[name].to_array()
+            buffer.extend(records)
+            if self.run_log is not None and len(records) > 0:
+                self.run_log.extend(name, records[records.dtype.names[0]])
 
     def save_all_data(self, directory):
         # Save each array to a separate file in the specified directory
@@ -71,3 +110,16 @@ class Reporter:
         np.save(f'{directory}/moving_cars_amount.npy', self.moving_cars_amount)
         np.save(f'{directory}/wait_time_punishment.npy', self.wait_time_punishment)
         np.save(f'{directory}/best_solutions.npy', self.best_solutions, allow_pickle=True)
+        if self.run_log is not None:
+            self.run_log.flush()
+
+    def close(self):
+        """
+        Close the run log and remove the temporary spill directory. The records spilled there can't be read anymore,
+        the saved data is kept.
+        """
+        if self.run_log is not None:
+            self.run_log.close()
+        if self.temporary_directory is not None:
+            self.temporary_directory.cleanup()
+            self.temporary_directory = None
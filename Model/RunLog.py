@@ -0,0 +1,187 @@
+import os
+import time
+from typing import Dict, List, Tuple
+import numpy as np
+
+# The number of buckets (or raw values, for the first level) summarized by a bucket of the next summary level.
+SUMMARY_FACTOR = 64
+# The number of summary levels, a bucket of level k summarizes SUMMARY_FACTOR ** k raw values.
+SUMMARY_LEVELS = 3
+RAW_DTYPE = np.dtype('<f8')
+SUMMARY_DTYPE = np.dtype([('min', '<f8'), ('mean', '<f8'), ('max', '<f8'), ('count', '<f8')])
+# The number of seconds between flushes of the log files, the delay of a RunLogReader following a live run
+FLUSH_INTERVAL = 1.0
+
+
+def log_path(directory: str, name: str, level: int) -> str:
+    """Return the file of a level of a series, level 0 being the raw values."""
+    return os.path.join(directory, f'{name}.log' if level == 0 else f'{name}.summary{level}')
+
+
+class RunLog:
+    """
+    An append-only log of scalar series, written while a run goes on.
+    Every value is appended to the raw file of its series, and complete buckets of SUMMARY_FACTOR values are
+    summarized (min, mean, max, count) into the summary files, each level summarizing the buckets of the one below.
+    The files are flushed at most every FLUSH_INTERVAL seconds and on close, so a RunLogReader can follow a live
+    run without a flush per record.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory of the log files, created if needed. Existing series are appended to, their
+            open buckets are rebuilt from the rows that no summary covers yet.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.files = {}
+        # The open bucket of every summary level of every series: [min, sum, max, count]
+        self.buckets: Dict[str, List[List[float]]] = {}
+        self.last_flush = time.monotonic()
+
+    def append(self, name: str, value: float) -> None:
+        """Append a value to a series."""
+        self.extend(name, [value])
+
+    def extend(self, name: str, values) -> None:
+        """Append several values to a series."""
+        values = np.asarray(values, dtype=RAW_DTYPE).reshape(-1)
+        if name not in self.files:
+            self.open_series(name)
+        files = self.files[name]
+        files[0].write(values.tobytes())
+        for value in values.tolist():
+            self.add_to_bucket(name, 1, value, value, value)
+        if time.monotonic() - self.last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write the buffered rows of every series to their files."""
+        for files in self.files.values():
+            for file in files:
+                file.flush()
+        self.last_flush = time.monotonic()
+
+    def open_series(self, name: str) -> None:
+        """
+        Open the files of a series. The files of an existing series are cut to their complete rows, and the open
+        bucket of every level is rebuilt from the rows of the level below that come after its last summary.
+        """
+        reader = RunLogReader(self.directory)
+        files = []
+        for level in range(SUMMARY_LEVELS + 1):
+            path = log_path(self.directory, name, level)
+            if os.path.exists(path):
+                # A run that stopped mid flush may have left a partial row
+                os.truncate(path, reader.length(name, level) * (RAW_DTYPE if level == 0 else SUMMARY_DTYPE).itemsize)
+            files.append(open(path, 'ab'))
+        self.files[name] = files
+
+        self.buckets[name] = []
+        for level in range(1, SUMMARY_LEVELS + 1):
+            rows = reader.read(name, level - 1, reader.length(name, level) * SUMMARY_FACTOR)
+            if len(rows) == 0:
+                self.buckets[name].append([np.inf, 0.0, -np.inf, 0])
+            elif level == 1:
+                self.buckets[name].append([rows.min(), rows.sum(), rows.max(), len(rows)])
+            else:
+                self.buckets[name].append([rows['min'].min(), (rows['mean'] * rows['count']).sum(),
+                                           rows['max'].max(), len(rows)])
+
+    def add_to_bucket(self, name: str, level: int, low: float, total: float, high: float) -> None:
+        """
+        Merge a value or a closed bucket of the level below into the open bucket of a level, closing it when full.
+        :param low: The minimum of the merged values.
+        :param total: The sum of the merged raw values.
+        :param high: The maximum of the merged values.
+        """
+        bucket = self.buckets[name][level - 1]
+        bucket[0] = min(bucket[0], low)
+        bucket[1] += total
+        bucket[2] = max(bucket[2], high)
+        bucket[3] += 1
+        if bucket[3] < SUMMARY_FACTOR:
+            return
+
+        low, total, high = bucket[0], bucket[1], bucket[2]
+        count = SUMMARY_FACTOR ** level
+        row = np.array([(low, total / count, high, count)], dtype=SUMMARY_DTYPE)
+        self.files[name][level].write(row.tobytes())
+        self.buckets[name][level - 1] = [np.inf, 0.0, -np.inf, 0]
+        if level < SUMMARY_LEVELS:
+            self.add_to_bucket(name, level + 1, low, total, high)
+
+    def close(self) -> None:
+        self.flush()
+        for files in self.files.values():
+            for file in files:
+                file.close()
+        self.files = {}
+
+    def __getstate__(self):
+        # Open files can't be sent to other processes, a copy of the log only keeps where it writes
+        return {'directory': self.directory}
+
+    def __setstate__(self, state):
+        self.__init__(state['directory'])
+
+
+class RunLogReader:
+    """Reads the series of a RunLog, possibly while it is still being written."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # The number of rows already returned by tail, by series and level
+        self.positions: Dict[Tuple[str, int], int] = {}
+
+    def series(self) -> List[str]:
+        """Return the names of the logged series."""
+        return sorted(name[:-len('.log')] for name in os.listdir(self.directory) if name.endswith('.log'))
+
+    def length(self, name: str, level: int = 0) -> int:
+        """Return the number of complete rows of a level of a series."""
+        path = log_path(self.directory, name, level)
+        if not os.path.exists(path):
+            return 0
+        return os.path.getsize(path) // (RAW_DTYPE if level == 0 else SUMMARY_DTYPE).itemsize
+
+    def read(self, name: str, level: int = 0, start: int = 0, stop: int = None) -> np.ndarray:
+        """
+        Read rows of a level of a series without loading the rest of the file.
+        :param name: The series.
+        :param level: 0 for the raw values, k for the summaries of SUMMARY_FACTOR ** k values.
+        :param start: The first row to read.
+        :param stop: The row to stop before, the last complete row by default.
+        :return: A float array of raw values, or a SUMMARY_DTYPE array of summaries.
+        """
+        dtype = RAW_DTYPE if level == 0 else SUMMARY_DTYPE
+        length = self.length(name, level)
+        stop = length if stop is None else min(stop, length)
+        if stop <= start:
+            return np.empty(0, dtype=dtype)
+        return np.fromfile(log_path(self.directory, name, level), dtype=dtype, count=stop - start,
+                           offset=start * dtype.itemsize)
+
+    def tail(self, name: str, level: int = 0) -> np.ndarray:
+        """Return the rows appended to a level of a series since the previous tail call."""
+        start = self.positions.get((name, level), 0)
+        rows = self.read(name, level, start)
+        self.positions[(name, level)] = start + len(rows)
+        return rows
+
+    def read_resolution(self, name: str, max_points: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Read a series at the finest resolution that has at most max_points points.
+        :return: The raw value index of every point and its mean, min and max. Raw values are their own mean,
+            min and max. When even the coarsest level is too long, its last max_points buckets are returned.
+        """
+        for level in range(SUMMARY_LEVELS + 1):
+            length = self.length(name, level)
+            if length <= max_points or level == SUMMARY_LEVELS:
+                break
+        first = max(0, length - max_points)
+        rows = self.read(name, level, first, length)
+        if level == 0:
+            return np.arange(first, first + len(rows)), rows, rows, rows
+        size = SUMMARY_FACTOR ** level
+        return (first + np.arange(len(rows))) * size + size / 2, rows['mean'], rows['min'], rows['max']
@@ -0,0 +1,45 @@
+from typing import Optional
+import numpy as np
+
+INDUSTRIAL_SIZE = 2
+RESIDENTIAL_SIZE = 2
+MAX_TIME_TO_START = 4
+
+
+class Scenario:
+    """
+    A compact description of a city: its residential and industrial coordinates and, for every car, the departure
+    time and the path. The paths of all the cars are packed in one array of junction indices (x * m + y), car k
+    owning paths[path_offsets[k]:path_offsets[k + 1]].
+    A scenario drawn by a ScenarioGenerator keeps its seed, (n, m, num_cars, seed) rebuilds it bit for bit.
+    """
+
+    def __init__(self, n: int, m: int, residential_coords: np.ndarray, industrial_coords: np.ndarray,
+                 start_times: np.ndarray, path_offsets: np.ndarray, paths: np.ndarray,
+                 seed: Optional[np.random.SeedSequence] = None):
+        """
+        :param n: Number of rows in the city grid.
+        :param m: Number of columns in the city grid.
+        :param residential_coords: An (R, 2) array of the residential coordinates.
+        :param industrial_coords: An (I, 2) array of the industrial coordinates.
+        :param start_times: The departure time of every car.
+        :param path_offsets: The (cars + 1) offsets of the cars paths in paths.
+        :param paths: The junction indices of all the cars paths.
+        :param seed: The seed the scenario was drawn from, if any.
+        """
+        self.n = n
+        self.m = m
+        self.residential_coords = residential_coords
+        self.industrial_coords = industrial_coords
+        self.start_times = start_times
+        self.path_offsets = path_offsets
+        self.paths = paths
+        self.seed = seed
+
+    @property
+    def num_cars(self) -> int:
+        return len(self.start_times)
+
+    def get_path(self, car: int) -> np.ndarray:
+        """Return the junction indices of a car path."""
+        return self.paths[self.path_offsets[car]:self.path_offsets[car + 1]]
@@ -0,0 +1,147 @@
+from typing import List, Tuple, Union
+import numpy as np
+from Model.Car import NOISE_CAR_PATH
+from Model.Grid import Grid
+from Model.Scenario import Scenario, INDUSTRIAL_SIZE, RESIDENTIAL_SIZE, MAX_TIME_TO_START
+from Model.TrafficLight import init_signal_plane
+
+# A seed of a scenario: an int, a SeedSequence, or None for fresh entropy
+Seed = Union[None, int, np.random.SeedSequence]
+
+
+def to_seed_sequence(seed: Seed) -> np.random.SeedSequence:
+    """
+    Return a new SeedSequence for a seed. A given SeedSequence is copied, so spawning from the result doesn't
+    change it and the same seed always spawns the same children.
+    """
+    if isinstance(seed, np.random.SeedSequence):
+        return np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+    return np.random.SeedSequence(seed)
+
+
+class ScenarioGenerator:
+    """
+    Generates the scenarios of cities with NumPy.
+    The sampling follows City.init_car and Car._init_path: the same residential and industrial
+    areas, the same normal location and departure time draws, the same highway following steps and the same path
+    noise, but every draw is done for all the cars of a city together.
+    Every city is drawn from its own random stream, built from its seed, so a city only depends on
+    (n, m, num_cars, seed) and a worker process can rebuild it from these few values.
+    """
+
+    def __init__(self, n: int, m: int, rng: np.random.Generator = None):
+        """
+        :param n: Number of rows in the city grid.
+        :param m: Number of columns in the city grid.
+        :param rng: The random generator the seeds are drawn from when none is given, a fresh unseeded one by default.
+        """
+        self.n = n
+        self.m = m
+        self.rng = rng if rng is not None else np.random.default_rng()
+        grid = Grid(init_signal_plane(n, m))
+        self.only_vertical = grid.is_vertical_highway & ~grid.is_horizontal_highway
+        self.only_horizontal = grid.is_horizontal_highway & ~grid.is_vertical_highway
+
+    def generate_scenarios(self, num_cars: int, num_cities: int, seed: Seed = None) -> List[Scenario]:
+        """
+        Generate the scenarios of several cities.
+        :param num_cars: The number of cars in each city.
+        :param num_cities: The number of cities.
+        :param seed: The seed of the set, city k is drawn from its k-th spawned child. Drawn from rng by default.
+        :return: A Scenario for every city.
+        """
+        return [self.generate_scenario(num_cars, city_seed) for city_seed in self.spawn_seeds(seed, num_cities)]
+
+    def spawn_seeds(self, seed: Seed, amount: int) -> List[np.random.SeedSequence]:
+        """Return the independent seeds of the cities of a set, see generate_scenarios."""
+        if seed is None:
+            seed = int(self.rng.integers(2 ** 63))
+        return to_seed_sequence(seed).spawn(amount)
+
+    def generate_scenario(self, num_cars: int, seed: Seed = None) -> Scenario:
+        """
+        Generate the scenario of a single city from its own random stream.
+        :param num_cars: The number of cars in the city.
+        :param seed: The seed of the city, the same seed always gives the same scenario. Drawn from rng by default.
+        :return: A Scenario that keeps its seed.
+        """
+        if seed is None:
+            seed = int(self.rng.integers(2 ** 63))
+        seed = to_seed_sequence(seed)
+        rng = np.random.default_rng(seed)
+        possible_residential = np.array([(i, j) for i in range(RESIDENTIAL_SIZE) for j in range(RESIDENTIAL_SIZE)])
+        possible_industrial = np.array([(self.n - 1 - i, self.m - 1 - j)
+                                        for i in range(INDUSTRIAL_SIZE) for j in range(INDUSTRIAL_SIZE)])
+        residential = self.sample_area(rng, possible_residential)
+        industrial = self.sample_area(rng, possible_industrial)
+
+        sources = self.sample_locations(rng, residential, num_cars)
+        destinations = self.sample_locations(rng, industrial, num_cars)
+        start_times = self.sample_departure_times(rng, num_cars)
+        path_offsets, paths = self.generate_paths(rng, sources, destinations)
+        return Scenario(self.n, self.m, residential, industrial, start_times, path_offsets, paths, seed)
+
+    @staticmethod
+    def sample_area(rng: np.random.Generator, possible_coords: np.ndarray) -> np.ndarray:
+        """Choose a random non-empty subset of the coordinates, in random order."""
+        amount = rng.integers(1, len(possible_coords) + 1)
+        return possible_coords[rng.permutation(len(possible_coords))[:amount]]
+
+    @staticmethod
+    def sample_locations(rng: np.random.Generator, coords: np.ndarray, amount: int) -> np.ndarray:
+        """Select locations based on a normal distribution among all locations, see City.get_random_location."""
+        indices = np.rint(rng.normal(len(coords) / 2, len(coords) / 6, amount)).astype(int)
+        return coords[np.clip(indices, 0, len(coords) - 1)]
+
+    @staticmethod
+    def sample_departure_times(rng: np.random.Generator, amount: int) -> np.ndarray:
+        """Generate normally distributed departure times, see City.get_normal_departure_time."""
+        times = np.rint(rng.normal(MAX_TIME_TO_START / 2, MAX_TIME_TO_START / 2, amount))
+        return np.clip(times, 0, MAX_TIME_TO_START).astype(np.int32)
+
+    def generate_paths(self, rng: np.random.Generator, sources: np.ndarray,
+                       destinations: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Choose the paths of all the cars, advancing every car one step at a time.
+        Each step moves one junction closer to the destination, so a path has exactly Manhattan distance + 1 junctions.
+        :param rng: The random stream of the city.
+        :param sources: A (cars, 2) array of sources.
+        :param destinations: A (cars, 2) array of destinations.
+        :return: The (cars + 1) path offsets and the packed junction indices of the paths.
+        """
+        x, y = sources[:, 0].copy(), sources[:, 1].copy()
+        dest_x, dest_y = destinations[:, 0], destinations[:, 1]
+        lengths = np.abs(dest_x - x) + np.abs(dest_y - y) + 1
+        steps = np.zeros((len(x), lengths.max(initial=1)), dtype=np.int32)
+        steps[:, 0] = x * self.m + y
+
+        for step in range(1, steps.shape[1]):
+            cars = np.flatnonzero(lengths > step)
+            cur_x, cur_y = x[cars], y[cars]
+            target_x, target_y = dest_x[cars], dest_y[cars]
+
+            # Follow the highway when the junction allows a single direction and it does not pass the destination
+            highway_x = cur_x + self.only_vertical[cur_x, cur_y]
+            highway_y = cur_y + self.only_horizontal[cur_x, cur_y]
+            on_highway = (highway_x != cur_x) | (highway_y != cur_y)
+            follow_highway = on_highway & (highway_x <= target_x) & (highway_y <= target_y)
+
+            # Otherwise move towards the destination, along x with probability |steps_x| / total_steps
+            steps_x, steps_y = target_x - cur_x, target_y - cur_y
+            move_x = rng.random(len(cars)) * (np.abs(steps_x) + np.abs(steps_y)) < np.abs(steps_x)
+            next_x = np.where(follow_highway, highway_x, cur_x + move_x * np.sign(steps_x))
+            next_y = np.where(follow_highway, highway_y, cur_y + ~move_x * np.sign(steps_y))
+
+            # Path noise, move along the other axis instead unless it passes the destination
+            moved_x = next_x != cur_x
+            flipped_x = np.where(moved_x, cur_x, cur_x + 1)
+            flipped_y = np.where(moved_x, cur_y + 1, cur_y)
+            flip = ((rng.random(len(cars)) < NOISE_CAR_PATH) &
+                    (flipped_x <= target_x) & (flipped_y <= target_y))
+            x[cars] = np.where(flip, flipped_x, next_x)
+            y[cars] = np.where(flip, flipped_y, next_y)
+            steps[cars, step] = x[cars] * self.m + y[cars]
+
+        path_offsets = np.concatenate(([0], np.cumsum(lengths)))
+        paths = steps[np.arange(steps.shape[1]) < lengths[:, None]]
+        return path_offsets, paths
@@ -0,0 +1,107 @@
+import json
+import os
+from typing import List, Optional, Sequence
+import numpy as np
+from Model.City import City, OBJECT_ENGINE
+from Model.Scenario import Scenario
+
+SCENARIO_STORE_VERSION = 1
+METADATA_FILE = 'scenarios.json'
+# Junction indices (x * m + y) and coordinates are stored as int16, so a stored grid has at most 32767 junctions
+PATH_DTYPE = np.dtype('<i2')
+COORDS_DTYPE = np.dtype('<i2')
+START_TIME_DTYPE = np.dtype('<i2')
+OFFSETS_DTYPE = np.dtype('<i8')
+# The arrays of a store, each one saved in its own .npy file so it can be memory-mapped.
+# A *_offsets array has an entry per city plus one, city k owning rows [offsets[k], offsets[k + 1]) of its array.
+STORE_ARRAYS = ('residential_offsets', 'residential', 'industrial_offsets', 'industrial', 'car_offsets',
+                'start_times', 'path_offsets', 'paths')
+
+
+def pack_offsets(lengths: Sequence[int]) -> np.ndarray:
+    return np.concatenate(([0], np.cumsum(lengths, dtype=OFFSETS_DTYPE))).astype(OFFSETS_DTYPE)
+
+
+class ScenarioStore:
+    """
+    A set of scenarios saved on disk, see save.
+    The arrays of all the cities are concatenated, the paths in CSR form with int16 junction indices, and loaded
+    memory-mapped: opening a store reads no scenario data, and a city only reads its own rows.
+    """
+
+    def __init__(self, directory: str, mmap_mode: Optional[str] = 'r'):
+        """
+        :param directory: The directory of a saved store.
+        :param mmap_mode: The memory-map mode of the arrays, None to read them into memory.
+        """
+        with open(os.path.join(directory, METADATA_FILE)) as file:
+            metadata = json.load(file)
+        if metadata['version'] != SCENARIO_STORE_VERSION:
+            raise ValueError(f"Unsupported scenario store version: {metadata['version']}")
+        self.directory = directory
+        self.n = metadata['n']
+        self.m = metadata['m']
+        self.seeds = metadata['seeds']
+        for name in STORE_ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mmap_mode))
+
+    @classmethod
+    def save(cls, directory: str, scenarios: List[Scenario]) -> 'ScenarioStore':
+        """
+        Save scenarios of the same grid size to a directory, created if needed.
+        :param directory: The directory of the store, existing store files are overwritten.
+        :param scenarios: The scenarios to save.
+        :return: The saved store, opened memory-mapped.
+        """
+        n, m = scenarios[0].n, scenarios[0].m
+        if any(scenario.n != n or scenario.m != m for scenario in scenarios):
+            raise ValueError("All the scenarios of a store must have the same grid size")
+        if n * m > np.iinfo(PATH_DTYPE).max:
+            raise ValueError(f"A {n}x{m} grid has too many junctions for the stored paths")
+
+        arrays = {
+            'residential_offsets': pack_offsets([len(scenario.residential_coords) for scenario in scenarios]),
+            'residential': np.concatenate([scenario.residential_coords for scenario in scenarios]).astype(COORDS_DTYPE),
+            'industrial_offsets': pack_offsets([len(scenario.industrial_coords) for scenario in scenarios]),
+            'industrial': np.concatenate([scenario.industrial_coords for scenario in scenarios]).astype(COORDS_DTYPE),
+            'car_offsets': pack_offsets([scenario.num_cars for scenario in scenarios]),
+            'start_times': np.concatenate([scenario.start_times for scenario in scenarios]).astype(START_TIME_DTYPE),
+            'path_offsets': pack_offsets(np.concatenate([np.diff(scenario.path_offsets) for scenario in scenarios])),
+            'paths': np.concatenate([scenario.paths for scenario in scenarios]).astype(PATH_DTYPE),
+        }
+        os.makedirs(directory, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), array)
+        seeds = [None if scenario.seed is None else {'entropy': scenario.seed.entropy,
+                                                     'spawn_key': list(scenario.seed.spawn_key)}
+                 for scenario in scenarios]
+        with open(os.path.join(directory, METADATA_FILE), 'w') as file:
+            json.dump({'version': SCENARIO_STORE_VERSION, 'n': n, 'm': m, 'seeds': seeds}, file)
+        return cls(directory)
+
+    def __len__(self) -> int:
+        return len(self.car_offsets) - 1
+
+    def get_scenario(self, index: int) -> Scenario:
+        """Return a stored scenario, its arrays are views of the store arrays."""
+        first_car, last_car = self.car_offsets[index], self.car_offsets[index + 1]
+        path_offsets = np.asarray(self.path_offsets[first_car:last_car + 1])
+        seed = self.seeds[index]
+        if seed is not None:
+            seed = np.random.SeedSequence(seed['entropy'], spawn_key=seed['spawn_key'])
+        return Scenario(self.n, self.m,
+                        self.residential[self.residential_offsets[index]:self.residential_offsets[index + 1]],
+                        self.industrial[self.industrial_offsets[index]:self.industrial_offsets[index + 1]],
+                        self.start_times[first_car:last_car],
+                        path_offsets - path_offsets[0],
+                        self.paths[path_offsets[0]:path_offsets[-1]],
+                        seed)
+
+    def get_scenarios(self, indices: Sequence[int] = None) -> List[Scenario]:
+        """Return the stored scenarios at the given indices, all of them by default."""
+        indices = range(len(self)) if indices is None else indices
+        return [self.get_scenario(index) for index in indices]
+
+    def load_cities(self, indices: Sequence[int] = None, engine: str = OBJECT_ENGINE) -> List[City]:
+        """Build the cities of the stored scenarios at the given indices, all of them by default."""
+        return [City.from_scenario(scenario, engine) for scenario in self.get_scenarios(indices)]
@@ -0,0 +1,50 @@
+from typing import Tuple
+import numpy as np
+from Model.Direction import Direction
+
+# Solutions and assignments are arrays of Direction values: 0 for HORIZONTAL and 1 for VERTICAL, one byte per light.
+SOLUTION_DTYPE = np.dtype(np.uint8)
+# The Direction of every value, to index with a solution array
+DIRECTIONS = np.array([Direction.HORIZONTAL, Direction.VERTICAL], dtype=object)
+
+
+def to_solution_array(solution: np.ndarray, validate: bool = True) -> np.ndarray:
+    """
+    Convert a solution or an assignment of any shape to its uint8 Direction values.
+    Arrays of Direction objects are converted, bool and integer arrays are only checked and cast, without a copy
+    when they are already uint8.
+    :param validate: Check the values of uint8 arrays, the format solutions are converted to once when they enter a
+        solver, so the per tick code skips the check. The values of other integer arrays are always checked.
+    :raises ValueError: If the array holds anything but the two directions.
+    """
+    solution = np.asarray(solution)
+    if solution.dtype == object:
+        vertical = solution == Direction.VERTICAL
+        if not np.all(vertical | (solution == Direction.HORIZONTAL)):
+            raise ValueError("Assignment contains invalid direction values")
+        return vertical.astype(SOLUTION_DTYPE)
+    checked = validate or solution.dtype != SOLUTION_DTYPE
+    if checked and solution.dtype != bool and solution.size and (solution.min() < 0 or solution.max() > 1):
+        raise ValueError("Assignment contains invalid direction values")
+    return solution.astype(SOLUTION_DTYPE, copy=False)
+
+
+def to_directions(solution: np.ndarray) -> np.ndarray:
+    """Return the Direction objects array of a solution, for code that still compares with Direction members."""
+    return DIRECTIONS[to_solution_array(solution)]
+
+
+def pack_solutions(solutions: np.ndarray) -> Tuple[np.ndarray, Tuple[int, ...]]:
+    """
+    Bit-pack solutions, one bit per light.
+    :param solutions: An array of solutions whose first axis is the solutions, e.g. (P, t, n, m).
+    :return: A (P, bytes) uint8 array and the shape to unpack it with.
+    """
+    solutions = to_solution_array(solutions)
+    return np.packbits(solutions.reshape(len(solutions), -1), axis=1), solutions.shape
+
+
+def unpack_solutions(packed: np.ndarray, shape: Tuple[int, ...]) -> np.ndarray:
+    """Unpack the solutions returned by pack_solutions."""
+    count = int(np.prod(shape[1:]))
+    return np.unpackbits(packed, axis=1, count=count).reshape(shape)
@@ -1,14 +1,43 @@
+from typing import List, Optional
+import numpy as np
 from Model.Direction import Direction
+from Model.Solution import DIRECTIONS, SOLUTION_DTYPE
 
 
 class TrafficLight:
-    def __init__(self):
-        self.current_direction: Direction = Direction.HORIZONTAL
+    """
+    A view of a single cell of a signal plane, the (n, m) uint8 array holding the light state (Direction value) of
+    every junction of a grid. The grid and the traffic system read and write the plane directly, these objects
+    remain for the code that handles a single light. A light created without a plane owns a 1x1 plane.
+    """
+
+    def __init__(self, plane: np.ndarray = None, x: int = 0, y: int = 0):
+        self.plane = plane if plane is not None else np.zeros((1, 1), dtype=SOLUTION_DTYPE)
+        self.x = x
+        self.y = y
 
     def get_current_direction(self) -> Direction:
         """Get the current direction of the traffic light."""
-        return self.current_direction
+        return DIRECTIONS[self.plane[self.x, self.y]]
 
     def set_direction(self, direction: Direction) -> None:
         """Set the direction of the traffic light."""
-        self.current_direction = direction
+        self.plane[self.x, self.y] = direction.value
+
+
+def init_signal_plane(n: int, m: int) -> List[List[TrafficLight]]:
+    """Create the traffic lights of an n x m grid as views of a new signal plane, all of them HORIZONTAL."""
+    plane = np.zeros((n, m), dtype=SOLUTION_DTYPE)
+    return [[TrafficLight(plane, i, j) for j in range(m)] for i in range(n)]
+
+
+def get_signal_plane(traffic_lights: List[List[TrafficLight]]) -> Optional[np.ndarray]:
+    """Return the signal plane of a grid of traffic lights, None if they are not the cells of a single plane."""
+    plane = traffic_lights[0][0].plane
+    if plane.shape != (len(traffic_lights), len(traffic_lights[0])):
+        return None
+    for i, row in enumerate(traffic_lights):
+        for j, light in enumerate(row):
+            if light.plane is not plane or light.x != i or light.y != j:
+                return None
+    return plane
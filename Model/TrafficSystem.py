@@ -1,25 +1,31 @@
 from typing import List
-from Model.TrafficLight import TrafficLight
-from Model.Direction import Direction
+from Model.TrafficLight import TrafficLight, get_signal_plane
+from Model.Solution import DIRECTIONS, to_solution_array
 import numpy as np
 
 
 class TrafficSystem:
     def __init__(self, traffic_lights: List[List[TrafficLight]]):
         self.traffic_lights = traffic_lights
+        # The signal plane shared with the grid, None when the traffic lights are independent objects
+        self.lights = get_signal_plane(traffic_lights)
 
     def update_traffic_lights(self, assignment: np.ndarray) -> None:
         """
         Update the traffic lights based on the given assignment.
 
-        :param assignment: An NxM numpy array where each element is either Direction.HORIZONTAL or Direction.VERTICAL.
+        :param assignment: An NxM numpy array where each element is either Direction.HORIZONTAL or Direction.VERTICAL,
+            or their integer values, see Model.Solution. uint8 values are trusted, the solvers validate a solution once.
+        :raises ValueError: If the assignment does not match the grid or holds invalid directions.
         """
         if assignment.shape != (len(self.traffic_lights), len(self.traffic_lights[0])):
             raise ValueError("Assignment dimensions do not match traffic light grid dimensions")
 
-        if not np.all(np.isin(assignment, [Direction.HORIZONTAL, Direction.VERTICAL])):
-            raise ValueError("Assignment contains invalid direction values")
-
+        values = to_solution_array(assignment, validate=False)
+        if self.lights is not None:
+            np.copyto(self.lights, values)
+            return
+        directions = DIRECTIONS[values]
         for i in range(len(self.traffic_lights)):
             for j in range(len(self.traffic_lights[0])):
-                self.traffic_lights[i][j].set_direction(assignment[i, j])
+                self.traffic_lights[i][j].set_direction(directions[i, j])
@@ -0,0 +1,170 @@
+from typing import List, Callable, Optional, Tuple
+import numpy as np
+from Model.ArrayEngine import ArrayEngine
+from Model.City import City, ARRAY_ENGINE, get_neighborhood_views
+from Model.Instrumentation import INSTRUMENTATION
+
+# A reward function maps the (4, K) metrics of the environments after a step and before it to their K rewards.
+# The metrics rows are the not reaching cars, total average wait time, car movements and wait time punishment,
+# the arguments order of Solver.evaluate.
+RewardFunction = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def movement_reward(metrics: np.ndarray, previous_metrics: np.ndarray) -> np.ndarray:
+    """Reward the number of car movements made in the step."""
+    return metrics[2] - previous_metrics[2]
+
+
+def wait_time_reward(metrics: np.ndarray, previous_metrics: np.ndarray) -> np.ndarray:
+    """Punish the growth of the total average wait time in the step."""
+    return previous_metrics[1] - metrics[1]
+
+
+def solver_score_reward(solver, cars_amount: int) -> RewardFunction:
+    """
+    Build a reward function that scores the metrics of every environment with a Solver, like evaluate_solution
+    scores a single city.
+    :param solver: The Solver whose evaluate normalizes and combines the metrics.
+    :param cars_amount: The number of cars in every city.
+    :return: A RewardFunction.
+    """
+    def reward(metrics: np.ndarray, previous_metrics: np.ndarray) -> np.ndarray:
+        return np.asarray(solver.evaluate(1, cars_amount, *metrics, False), dtype=float)
+    return reward
+
+
+class VectorEnv:
+    """
+    A batch of K city environments stepped together.
+    step takes an assignment for every city and returns their stacked observations, rewards and done flags. An
+    environment is done when it reaches the horizon or drains (no car will move anymore); with auto_reset it is then
+    brought back to its initial state, so the returned observation is the first one of its next episode.
+    Observations are the (n, m, 4) city state tensors, see Grid.get_state_tensor.
+    Cities on the array engine are stacked into a single multi simulation ArrayEngine, which steps and measures all
+    of them at once; the cities themselves are then left untouched.
+    """
+
+    def __init__(self, cities: List[City], horizon: int, reward_function: RewardFunction = movement_reward,
+                 auto_reset: bool = True):
+        """
+        :param cities: The cities to step, all of them n x m.
+        :param horizon: The number of ticks of an episode.
+        :param reward_function: Computes the rewards of a step from the metrics before and after it.
+        :param auto_reset: Reset the environments that are done at the end of every step.
+        """
+        self.cities = cities
+        self.horizon = horizon
+        self.reward_function = reward_function
+        self.auto_reset = auto_reset
+        self.n = cities[0].n
+        self.m = cities[0].m
+        self.engine: Optional[ArrayEngine] = None
+        self.initial_snapshots = []
+        if all(city.engine is not None for city in cities):
+            self.engine = ArrayEngine.from_cities(cities)
+        else:
+            for city in cities:
+                city.reset_city()
+            self.initial_snapshots = [city.snapshot() for city in cities]
+        self.metrics = self.get_metrics()
+        # The last observation of the environments that were reset by the last step
+        self.final_observations = np.zeros((len(cities), self.n, self.m, 4), dtype=int)
+
+    @classmethod
+    def generate(cls, n: int, m: int, num_cars: int, num_envs: int, horizon: int, engine: str = ARRAY_ENGINE,
+                 **kwargs) -> 'VectorEnv':
+        """
+        Generate the cities of the environments, see City.generate_cities.
+        :param kwargs: Passed to the VectorEnv constructor.
+        """
+        return cls(City.generate_cities(n, m, num_cars, num_envs, engine), horizon, **kwargs)
+
+    @property
+    def num_envs(self) -> int:
+        return len(self.cities)
+
+    def reset(self) -> np.ndarray:
+        """
+        Bring all the environments back to their initial state.
+        :return: The (K, n, m, 4) observations.
+        """
+        if self.engine is not None:
+            self.engine.reset()
+        for city, snapshot in zip(self.cities, self.initial_snapshots):
+            city.restore(snapshot)
+        self.metrics = self.get_metrics()
+        return self.get_observations()
+
+    def reset_envs(self, envs: np.ndarray) -> None:
+        """Bring some environments back to their initial state."""
+        if self.engine is not None:
+            self.engine.reset_sims(envs)
+            self.metrics[:, envs] = self.engine.get_metrics()[:, envs]
+            return
+        for env in envs:
+            self.cities[env].restore(self.initial_snapshots[env])
+            self.metrics[:, env] = self.get_city_metrics(self.cities[env])
+
+    def reset_env(self, env: int) -> None:
+        """Bring a single environment back to its initial state."""
+        self.reset_envs(np.array([env]))
+
+    def step(self, assignments: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Forward every environment by one tick.
+        :param assignments: A (K, n, m) array with the traffic light assignment of every city.
+        :return: The (K, n, m, 4) observations, the (K,) rewards and the (K,) done flags.
+        """
+        if len(assignments) != self.num_envs:
+            raise ValueError("Expected an assignment for every environment")
+        if self.engine is not None:
+            INSTRUMENTATION.count('ticks', self.num_envs)
+            with INSTRUMENTATION.phase('engine_update'):
+                self.engine.update(assignments)
+        else:
+            for city, assignment in zip(self.cities, assignments):
+                city.update_city(assignment)
+
+        metrics = self.get_metrics()
+        rewards = np.asarray(self.reward_function(metrics, self.metrics), dtype=float)
+        self.metrics = metrics
+        dones = self.get_dones()
+
+        observations = self.get_observations()
+        if self.auto_reset and dones.any():
+            envs = np.flatnonzero(dones)
+            self.final_observations[envs] = observations[envs]
+            self.reset_envs(envs)
+            observations[envs] = self.get_observations()[envs]
+        return observations, rewards, dones
+
+    def get_dones(self) -> np.ndarray:
+        """Return the (K,) flags of the environments that reached the horizon or drained."""
+        if self.engine is not None:
+            return (self.engine.sim_times() >= self.horizon) | self.engine.drained_sims()
+        return np.array([city.time >= self.horizon or city.is_drained() for city in self.cities])
+
+    def get_observations(self) -> np.ndarray:
+        """Return the (K, n, m, 4) state tensors of the cities."""
+        if self.engine is not None:
+            return self.engine.get_state_tensors()
+        return np.stack([city.get_state_tensor() for city in self.cities])
+
+    def get_neighborhood_observations(self, rows: int, cols: int) -> np.ndarray:
+        """
+        Return the flat states of all the rows x cols neighborhoods of every city, see City.get_neighborhood_views.
+        :return: A (K, neighborhoods, rows * cols * 4) array.
+        """
+        neighborhoods = (self.n - rows + 1) * (self.m - cols + 1)
+        return get_neighborhood_views(self.get_observations(), rows, cols).reshape(self.num_envs, neighborhoods, -1)
+
+    def get_metrics(self) -> np.ndarray:
+        """Return the (4, K) current metrics of the cities, see RewardFunction."""
+        if self.engine is not None:
+            return self.engine.get_metrics().astype(float)
+        return np.array([self.get_city_metrics(city) for city in self.cities], dtype=float).T
+
+    @staticmethod
+    def get_city_metrics(city: City) -> List[float]:
+        return [city.active_cars_amount(), city.get_current_avg_wait_time(), city.get_total_cars_movements(),
+                city.get_wait_time_punishment()]
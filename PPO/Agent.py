@@ -1,5 +1,6 @@
 import numpy as np
 import torch as T
+from Model.Instrumentation import INSTRUMENTATION
 from PPO.ActorNetwork import ActorNetwork
 from PPO.CriticNetwork import CriticNetwork
 from PPO.PPOMemory import PPOMemory
@@ -7,6 +8,26 @@ from PPO.PPOMemory import PPOMemory
 C1 = 0.5
 
 
+def discounted_reverse_cumsum(values: np.ndarray, decays: np.ndarray) -> np.ndarray:
+    """
+    Compute a[t] = values[t] + decays[t] * a[t + 1], with a[N] = 0, as a vectorized reverse scan.
+    The recurrence is composed over spans that double in length, log2(N) whole array steps, and only ever multiplies
+    decays together, so long spans of small decays underflow to 0 instead of overflowing.
+    :param values: The (N,) values to accumulate.
+    :param decays: The (N,) factor applied to the accumulated sum of the following steps, 0 ends a span.
+    :return: The (N,) accumulated values.
+    """
+    sums = np.array(values, dtype=np.float64)
+    factors = np.array(decays, dtype=np.float64)
+    shift = 1
+    while shift < len(sums):
+        # Every step takes on the sum of the next `shift` steps, and the factor to apply after them
+        sums[:-shift] += factors[:-shift] * sums[shift:]
+        factors[:-shift] *= factors[shift:]
+        shift *= 2
+    return sums
+
+
 class Agent:
     def __init__(self, input_dims, n_actions, gamma=0.99, alpha=0.0003, gae_lambda=0.95,
                  policy_clip=0.2, batch_size=64, n_epoch=10):
@@ -17,7 +38,7 @@ class Agent:
 
         self.actor = ActorNetwork(n_actions, input_dims, alpha)
         self.critic = CriticNetwork(input_dims, alpha)
-        self.memory = PPOMemory(batch_size)
+        self.memory = PPOMemory(batch_size, input_dims)
 
     def remember(self, state, action, prob, val, reward, done):
         """
@@ -47,12 +68,29 @@ class Agent:
         self.actor.load_checkpoint()
         self.critic.load_checkpoint()
 
+    def get_weights(self):
+        """
+        Return a copy of the actor and critic parameters on the CPU, to be sent to other processes.
+        :return: A dictionary with the actor and critic state dictionaries.
+        """
+        return {name: {key: value.detach().cpu().clone() for key, value in network.state_dict().items()}
+                for name, network in (('actor', self.actor), ('critic', self.critic))}
+
+    def set_weights(self, weights):
+        """
+        Load parameters returned by get_weights.
+        :param weights: A dictionary with the actor and critic state dictionaries.
+        """
+        self.actor.load_state_dict(weights['actor'])
+        self.critic.load_state_dict(weights['critic'])
+
     def choose_action(self, observation):
         """
         Choose an action based on the current observation of the environment.
         :param observation: The current state of the environment.
         :return: The selected action, log probability of the action, and value estimate of the state.
         """
+        INSTRUMENTATION.count('forward_passes')
         state = T.tensor([observation], dtype=T.float).to(self.actor.device)
         dist = self.actor(state)
         value = self.critic(state)
@@ -64,22 +102,40 @@ class Agent:
 
         return action, probs, value
 
+    def choose_actions(self, observations: np.ndarray, deterministic: bool = False) -> np.ndarray:
+        """
+        Choose an action for every observation of a batch with a single forward pass of the actor.
+        The critic is not evaluated and no gradients are recorded, so this is only meant for inference.
+        :param observations: A (batch, *input_dims) array of observations.
+        :param deterministic: Take the most probable action instead of sampling one.
+        :return: The selected action of every observation.
+        """
+        INSTRUMENTATION.count('forward_passes')
+        with T.no_grad():
+            states = T.as_tensor(np.asarray(observations), dtype=T.float, device=self.actor.device)
+            dist = self.actor(states)
+            actions = dist.probs.argmax(dim=-1) if deterministic else dist.sample()
+        return actions.cpu().numpy()
+
     def learn(self):
         """
         Perform learning by updating the actor and critic networks using the collected experiences.
         """
-        for _ in range(self.n_epochs):
-            state_arr, action_arr, old_probs_arr, vals_arr, reword_arr, done_arr, batches = \
-                self.memory.generate_batches()
+        state_arr, action_arr, old_probs_arr, vals_arr, reword_arr, done_arr = self.memory.get_arrays()
+        # The stored values and rewards don't change between the epochs, so the advantages are computed once
+        advantages = self.generate_advantages(done_arr.numpy(), reword_arr.numpy(), vals_arr.numpy())
+        # Move the rollout to the device once, the mini-batches index into it
+        state_arr = state_arr.to(self.actor.device, dtype=T.float)
+        action_arr = action_arr.to(self.actor.device, dtype=T.float)
+        old_probs_arr = old_probs_arr.to(self.actor.device)
+        values = vals_arr.to(self.actor.device)
 
-            values = vals_arr
-            advantages = self.generate_advantages(done_arr, reword_arr, values)
-            values = T.tensor(values).to(self.actor.device)
-
-            for batch in batches:
-                states = T.tensor(state_arr[batch], dtype=T.float).to(self.actor.device)
-                old_probs = T.tensor(old_probs_arr[batch], dtype=T.float).to(self.actor.device)
-                actions = T.tensor(action_arr[batch], dtype=T.float).to(self.actor.device)
+        for _ in range(self.n_epochs):
+            for batch in self.memory.get_batches():
+                batch = batch.to(self.actor.device)
+                states = state_arr[batch]
+                old_probs = old_probs_arr[batch]
+                actions = action_arr[batch]
 
                 dist = self.actor(states)
                 critic_value = self.critic(states)
@@ -105,19 +161,17 @@ class Agent:
 
     def generate_advantages(self, done_arr, reword_arr, values):
         """
-        Calculate the advantage estimates used for policy updates.
+        Calculate the generalized advantage estimates used for policy updates, in a single reverse scan.
+        An episode ends at a done step, so the advantages never look past it. The last step has no next value in
+        memory, its TD residual bootstraps from 0, which is exact when it is the done step of an episode.
         :param done_arr: Array indicating whether an episode has finished.
         :param reword_arr: Array of received rewards.
         :param values: Array of value estimates from the critic network.
         :return: Tensor containing the calculated advantages.
         """
-        advantage = np.zeros(len(reword_arr), dtype=np.float32)
-        for t in range(len(reword_arr) - 1):
-            discount = 1
-            a_t = 0
-            for k in range(t, len(reword_arr) - 1):
-                a_t = discount * (reword_arr[k] + self.gamma * values[k + 1] * (1 - int(done_arr[k])) - values[k])
-                discount *= self.gamma * self.gae_lambda
-
-            advantage[t] = a_t
-        return T.tensor(advantage).to(self.actor.device)
+        values = np.asarray(values, dtype=np.float64)
+        not_done = 1 - np.asarray(done_arr, dtype=np.float64)
+        next_values = np.append(values[1:], 0.0)
+        deltas = np.asarray(reword_arr, dtype=np.float64) + self.gamma * next_values * not_done - values
+        advantage = discounted_reverse_cumsum(deltas, self.gamma * self.gae_lambda * not_done)
+        return T.tensor(advantage.astype(np.float32)).to(self.actor.device)
@@ -1,34 +1,81 @@
 import numpy as np
+import torch as T
+
+# The number of experiences the buffers are allocated for, they double when a rollout needs more.
+DEFAULT_CAPACITY = 1024
 
 
 class PPOMemory:
-    def __init__(self, batch_size):
-        self.states = []
-        self.probs = []
-        self.vals = []
-        self.actions = []
-        self.rewards = []
-        self.dones = []
+    """
+    A rollout buffer backed by preallocated contiguous tensors.
+    Experiences are written in place, one row per step, and read back as views of the filled rows. The observations
+    are small car counts and highway flags, so they are stored as int16; storing a value outside the range of the
+    state dtype raises a ValueError instead of wrapping around.
+    """
+
+    def __init__(self, batch_size, input_dims=(1,), capacity=DEFAULT_CAPACITY, state_dtype=T.int16):
+        """
+        :param batch_size: The number of experiences in each mini-batch.
+        :param input_dims: The shape of a single observation.
+        :param capacity: The initial number of experiences the buffers can hold.
+        :param state_dtype: The dtype the observations are stored with, see to_states.
+        """
         self.batch_size = batch_size
+        self.size = 0
+        self.states = T.zeros((capacity, *input_dims), dtype=state_dtype)
+        self.actions = T.zeros(capacity, dtype=T.int64)
+        self.probs = T.zeros(capacity, dtype=T.float32)
+        self.vals = T.zeros(capacity, dtype=T.float32)
+        self.rewards = T.zeros(capacity, dtype=T.float32)
+        self.dones = T.zeros(capacity, dtype=T.bool)
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return len(self.actions)
 
     def generate_batches(self):
         """
         Generate random batches from stored experiences.
-        :return: Arrays of stored states, actions, probabilities, values, rewards, dones, and the generated batches.
+        :return: Views of the stored states, actions, probabilities, values, rewards, dones, and the generated batches.
+        """
+        return *self.get_arrays(), self.get_batches()
+
+    def get_arrays(self):
+        """
+        Return the stored experiences, without copying them.
+        :return: Tensor views of the stored states, actions, probabilities, values, rewards and dones.
         """
-        n_states = len(self.states)
-        batch_start = np.arange(0, n_states, self.batch_size)
-        indices = np.arange(n_states, dtype=np.int64)
+        return self.states[:self.size], \
+            self.actions[:self.size], \
+            self.probs[:self.size], \
+            self.vals[:self.size], \
+            self.rewards[:self.size], \
+            self.dones[:self.size]
+
+    def get_batches(self):
+        """
+        Split the indices of the stored experiences into random batches.
+        :return: A list of index tensors.
+        """
+        indices = np.arange(self.size, dtype=np.int64)
         np.random.shuffle(indices)
-        batches = [indices[i:i + self.batch_size] for i in batch_start]
+        return list(T.from_numpy(indices).split(self.batch_size))
 
-        return np.array(self.states), \
-            np.array(self.actions), \
-            np.array(self.probs), \
-            np.array(self.vals), \
-            np.array(self.rewards), \
-            np.array(self.dones), \
-            batches
+    def to_states(self, states):
+        """
+        Convert observations to a tensor the state buffer can hold.
+        :raises ValueError: If a value is outside the range of an integer state dtype.
+        """
+        states = T.as_tensor(np.asarray(states))
+        if states.numel() > 0 and not self.states.dtype.is_floating_point and self.states.dtype != T.bool:
+            limits = T.iinfo(self.states.dtype)
+            if states.min() < limits.min or states.max() > limits.max:
+                raise ValueError(f"Observation values out of the {self.states.dtype} range "
+                                 f"[{limits.min}, {limits.max}], use a wider state_dtype")
+        return states
 
     def store_memory(self, state, action, prob, val, reward, done):
         """
@@ -40,20 +87,48 @@ class PPOMemory:
         :param reward: The reward received.
         :param done: Boolean indicating whether the episode is finished.
         """
-        self.states.append(state)
-        self.probs.append(prob)
-        self.actions.append(action)
-        self.vals.append(val)
-        self.rewards.append(reward)
-        self.dones.append(done)
+        if self.size == self.capacity:
+            self.grow()
+        self.states[self.size].copy_(self.to_states(state).reshape(self.states.shape[1:]))
+        self.actions[self.size] = action
+        self.probs[self.size] = prob
+        self.vals[self.size] = val
+        self.rewards[self.size] = reward
+        self.dones[self.size] = bool(done)
+        self.size += 1
+
+    def store_batch(self, states, actions, probs, vals, rewards, dones):
+        """
+        Store a sequence of experiences, as returned by get_arrays.
+        :param states: The observed states.
+        :param actions: The actions taken.
+        :param probs: The probabilities of the taken actions.
+        :param vals: The value estimates of the states.
+        :param rewards: The rewards received.
+        :param dones: Whether the episode finished at every experience.
+        """
+        amount = len(actions)
+        while self.size + amount > self.capacity:
+            self.grow()
+        batch = slice(self.size, self.size + amount)
+        self.states[batch] = self.to_states(states).reshape(amount, *self.states.shape[1:])
+        self.actions[batch] = T.as_tensor(np.asarray(actions))
+        self.probs[batch] = T.as_tensor(np.asarray(probs))
+        self.vals[batch] = T.as_tensor(np.asarray(vals))
+        self.rewards[batch] = T.as_tensor(np.asarray(rewards))
+        self.dones[batch] = T.as_tensor(np.asarray(dones))
+        self.size += amount
+
+    def grow(self):
+        """Double the capacity of the buffers, keeping the stored experiences."""
+        for name in ('states', 'actions', 'probs', 'vals', 'rewards', 'dones'):
+            buffer = getattr(self, name)
+            grown = T.zeros((2 * len(buffer), *buffer.shape[1:]), dtype=buffer.dtype)
+            grown[:len(buffer)] = buffer
+            setattr(self, name, grown)
 
     def clear_memory(self):
         """
-        Clear all stored experiences from memory.
+        Clear all stored experiences from memory. The buffers are kept for the next rollout.
         """
-        self.states.clear()
-        self.probs.clear()
-        self.actions.clear()
-        self.rewards.clear()
-        self.dones.clear()
-        self.vals.clear()
+        self.size = 0
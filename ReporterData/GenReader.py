@@ -1,79 +1,38 @@
-import numpy as np
-from matplotlib import pyplot as plt
+import sys
 
 from Model.City import City
 from Model.Direction import Direction
+from ReporterData.LiveReader import follow, plot_series
 
 m = 8
 n = 8
 t = 40
 num_cars = 350
+# The run log directory of the genetic algorithm Reporter, see Reporter log_directory
+log_directory = 'GAResults/RunLog'
 
+# The plotted series: their color, title, y label and the factor their values are scaled by
+SERIES = [
+    ('moving_cars_amount', 'blue', 'General Traffic Flow', 'Number Of Cars That Moved', 1 / t),
+    ('not_reaching_cars', 'purple', 'How Many Cars Were Late', 'Number Of Cars', 1),
+    ('wait_time_punishment', 'green', 'Car Starvation Punishment', 'Average Car Starvation Punishment', 1 / (m * n)),
+    ('wait_times', 'orange', 'Average Car Wait Time', 'Average Time', (m * n) / num_cars),
+]
 
-def process_avg_wait_time(data_avg_wait_time):
-    data_avg_wait_time = data_avg_wait_time['avg_wait_time'].flatten()
-    return data_avg_wait_time * ((m * n) / num_cars)
 
-
-def process_moving(data_moving):
-    data_moving = data_moving['active_car'].flatten()
-    return data_moving / t
-
-
-def process_punishment(data_wait_punishment):
-    data_wait_punishment = data_wait_punishment['wait_punishment'].flatten()
-    return data_wait_punishment / (m * n)
-
-
-def load_data():
-    """Load the necessary data from .npy files."""
-    data_moving = np.load(f'GAResults/moving_cars_amount.npy').flatten()
-    data_not_reaching = np.load(f'GAResults/not_reaching_cars.npy').flatten()
-    data_wait_punishment = np.load(f'GAResults/wait_time_punishment.npy').flatten()
-    data_avg_wait_time = np.load(f'GAResults/wait_times_check.npy').flatten()
-    data_best = np.load(f'GAResults/best_solutions.npy', allow_pickle=True)
-
-    data_moving = process_moving(data_moving)
-    data_avg_wait_time = process_avg_wait_time(data_avg_wait_time)
-    data_wait_punishment = process_punishment(data_wait_punishment)
-
-    return data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, data_best
-
-def plot_data(y_values, color, title, ylabel):
-    """Plot a single dataset with baseline value."""
-    x_values = range(len(y_values))
-    plt.figure()
-    plt.plot(x_values, y_values, label='Genetic Algorithm', color=color)
-    plt.legend()
-    plt.xlabel('Generation')
-    plt.ylabel(ylabel)
-    plt.title(title)
-    plt.grid(True)
-    plt.show()
-
-
-def plot_fitness(data_best):
-    """Plot the best fitness values over generations."""
-    x_values = range(len(data_best))
-    fitness_values = data_best['fitness'].flatten()
-    plt.figure()
-    plt.plot(x_values, fitness_values, label='Genetic Algorithm')
-    plt.legend()
-    plt.title('Best Fitness Over Generations')
-    plt.xlabel('Generation')
-    plt.ylabel('Best Fitness Score')
-    plt.grid(True)
-    plt.show()
+def draw(figure, reader):
+    """Draw every series of the run log, with the best fitness over the generations."""
+    for index, (name, color, title, ylabel, scale) in enumerate(SERIES):
+        plot_series(figure.add_subplot(len(SERIES) + 1, 1, index + 1), reader, name, title, scale, color,
+                    'Genetic Algorithm', 'Generation', ylabel)
+    plot_series(figure.add_subplot(len(SERIES) + 1, 1, len(SERIES) + 1), reader, 'best_solutions',
+                'Best Fitness Over Generations', label='Genetic Algorithm', xlabel='Generation',
+                ylabel='Best Fitness Score')
 
 
 def main():
-    """Main function to load data and generate plots."""
-    data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, data_best = load_data()
-    plot_data(data_moving, 'blue', 'General Traffic Flow', 'Number Of Cars That Moved')
-    plot_data(data_not_reaching, 'purple', 'How Many Cars Were Late', 'Number Of Cars')
-    plot_data(data_wait_punishment, 'green', 'Car Starvation Punishment', 'Average Car Starvation Punishment')
-    plot_data(data_avg_wait_time, 'orange', 'Average Car Wait Time', 'Average Time')
-    plot_fitness(data_best)
+    """Plot the run log of a genetic algorithm run, redrawn while the run goes on."""
+    follow(sys.argv[1] if len(sys.argv) > 1 else log_directory, draw)
 
 
 if __name__ == "__main__":
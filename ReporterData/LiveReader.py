@@ -0,0 +1,68 @@
+import sys
+from typing import Callable
+
+from matplotlib import pyplot as plt
+
+from Model.RunLog import RunLogReader
+
+# The run log directory, given to the Reporter as log_directory
+log_directory = 'RunLog'
+# The maximum number of points drawn per series, longer histories are drawn from the summary levels
+max_points = 2000
+# The number of seconds between redraws
+refresh_interval = 5
+
+TITLES = {
+    'moving_cars_amount': 'General Traffic Flow',
+    'not_reaching_cars': 'How Many Cars Were Late',
+    'wait_time_punishment': 'Car Starvation Punishment',
+    'wait_times': 'Average Car Wait Time',
+    'best_solutions': 'Best Fitness',
+}
+
+
+def plot_series(axis, reader, name, title=None, scale=1.0, color=None, label=None, xlabel='Record', ylabel=None):
+    """
+    Draw the mean of a series with its min/max band, at the finest resolution that fits max_points.
+    :param scale: A positive factor the values are multiplied by before drawing.
+    """
+    x_values, mean, low, high = reader.read_resolution(name, max_points)
+    axis.clear()
+    axis.fill_between(x_values, low * scale, high * scale, alpha=0.3, color=color)
+    axis.plot(x_values, mean * scale, color=color, label=label)
+    axis.set_title(title or TITLES.get(name, name))
+    axis.set_xlabel(xlabel)
+    if ylabel is not None:
+        axis.set_ylabel(ylabel)
+    if label is not None:
+        axis.legend()
+    axis.grid(True)
+
+
+def follow(directory: str, draw: Callable) -> None:
+    """
+    Call draw(figure, reader) every refresh_interval seconds until the window is closed, so a run can be followed
+    while it goes on.
+    """
+    reader = RunLogReader(directory)
+    figure = plt.figure()
+    while plt.fignum_exists(figure.number):
+        figure.clear()
+        draw(figure, reader)
+        figure.tight_layout()
+        plt.pause(refresh_interval)
+
+
+def draw_all_series(figure, reader):
+    names = reader.series()
+    for index, name in enumerate(names):
+        plot_series(figure.add_subplot(len(names), 1, index + 1), reader, name)
+
+
+def main():
+    """Redraw all the series of a run log until the window is closed."""
+    follow(sys.argv[1] if len(sys.argv) > 1 else log_directory, draw_all_series)
+
+
+if __name__ == "__main__":
+    main()
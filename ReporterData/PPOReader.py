@@ -1,78 +1,67 @@
+import sys
+
 import numpy as np
 from matplotlib import pyplot as plt
 
 from Model.City import City
 from Model.Direction import Direction
+from Model.RunLog import SUMMARY_FACTOR, SUMMARY_LEVELS
+from ReporterData.LiveReader import follow, plot_series, max_points
 
 m = 8
 n = 8
 t = 40
 num_cars = 350
+# The run log directory of the PPO Reporter, see Reporter log_directory
+log_directory = 'PPOResults/RunLog'
+
+# The plotted series: their color, title, y label and the factor their values are scaled by
+SERIES = [
+    ('moving_cars_amount', '#87CEFA', 'General Traffic Flow', 'Number Of Cars That Moved', 1 / t),
+    ('not_reaching_cars', '#B2D8D8', 'How Many Cars Were Late', 'Number Of Cars', 1),
+    ('wait_time_punishment', '#98FB98', 'Car Starvation Punishment', 'Average Car Starvation Punishment', 1 / (m * n)),
+    ('wait_times', '#FFA07A', 'Average Car Wait Time', 'Average Time', (m * n) / num_cars),
+]
+
+
+def read_means(reader, names):
+    """
+    Read the means of series at the finest resolution where the longest one fits max_points, cut to the shortest.
+    :return: The raw value index of every point and the means of every series.
+    """
+    for level in range(SUMMARY_LEVELS + 1):
+        if max(reader.length(name, level) for name in names) <= max_points or level == SUMMARY_LEVELS:
+            break
+    rows = [reader.read(name, level) for name in names]
+    length = min(len(row) for row in rows)
+    first = max(0, length - max_points)
+    means = [row[first:length] if level == 0 else row['mean'][first:length] for row in rows]
+    size = SUMMARY_FACTOR ** level
+    x_values = (first + np.arange(length - first)) * size + (size / 2 if level > 0 else 0)
+    return x_values, means
+
+
+def plot_score(axis, reader):
+    """Draw the evaluation score, computed from the bucket means of the metrics when the run is long."""
+    x_values, means = read_means(reader, [name for name, *_ in SERIES])
+    data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time = [
+        mean * scale for mean, (*_, scale) in zip(means, SERIES)]
+    evaluation_scores = evaluate_data(data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, t, m, n)
 
+    axis.plot(x_values, evaluation_scores, color='#FFB6C1', label='PPO Algorithm')
+    axis.legend()
+    axis.set_xlabel('Learning Iterations Over Cities')
+    axis.set_ylabel('Score')
+    axis.set_title('Evaluation Score Over Time')
+    axis.grid(True)
 
-def process_avg_wait_time(data_avg_wait_time):
-    data_avg_wait_time = data_avg_wait_time['avg_wait_time'].flatten()
-    return data_avg_wait_time * ((m * n) / num_cars)
-
-
-def process_moving(data_moving):
-    data_moving = data_moving['active_car'].flatten()
-    return data_moving / t
-
-
-def process_punishment(data_wait_punishment):
-    data_wait_punishment = data_wait_punishment['wait_punishment'].flatten()
-    return data_wait_punishment / (m * n)
-
-
-def load_data():
-    """Load the necessary data from .npy files."""
-    data_moving = np.load(f'PPOResults/moving_cars_amount.npy').flatten()
-    data_not_reaching = np.load(f'PPOResults/not_reaching_cars.npy').flatten()
-    data_wait_punishment = np.load(f'PPOResults/wait_time_punishment.npy').flatten()
-    data_avg_wait_time = np.load(f'PPOResults/wait_times_check.npy').flatten()
-    data_best = np.load(f'PPOResults/best_solutions.npy', allow_pickle=True)
-
-    data_moving = process_moving(data_moving)
-    data_avg_wait_time = process_avg_wait_time(data_avg_wait_time)
-    data_wait_punishment = process_punishment(data_wait_punishment)
-    data_not_reaching = data_not_reaching['cars_num']
-
-    return data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, data_best
-
-
-def plot_data(y_values, color, title, ylabel):
-    """Plot a single dataset with baseline value and a moving average."""
-    x_values = range(len(y_values))
-
-    # Calculate moving average
-    moving_avg = np.convolve(y_values, np.ones(50)/50, mode='valid')  # Adjust the window size (10) as needed
-
-    plt.figure()
-    plt.plot(x_values, y_values, label='PPO Algorithm', color=color)
-    plt.plot(range(len(moving_avg)), moving_avg, label='Average Value', color='black', linestyle='--')
-    plt.legend()
-    plt.xlabel('Learning Iterations Over Cities')
-    plt.ylabel(ylabel)
-    plt.title(title)
-    plt.grid(True)
-    plt.show()
-
-
-def plot_score(data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time):
-    # Calculate the evaluation score
-    evaluation_scores = evaluate_data(data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, t, m, n)
-    moving_avg = np.convolve(evaluation_scores, np.ones(50)/50, mode='valid')
 
-    # Plotting the evaluation scores
-    plt.plot(evaluation_scores, color='#FFB6C1', label='PPO Algorithm')
-    plt.plot(range(len(moving_avg)), moving_avg, label='Average Value', color='black', linestyle='--')
-    plt.legend()
-    plt.xlabel('Learning Iterations Over Cities')
-    plt.ylabel('Score')
-    plt.title('Evaluation Score Over Time')
-    plt.legend()
-    plt.show()
+def draw(figure, reader):
+    """Draw the evaluation score and every series of the run log."""
+    plot_score(figure.add_subplot(len(SERIES) + 1, 1, 1), reader)
+    for index, (name, color, title, ylabel, scale) in enumerate(SERIES):
+        plot_series(figure.add_subplot(len(SERIES) + 1, 1, index + 2), reader, name, title, scale, color,
+                    'PPO Algorithm', 'Learning Iterations Over Cities', ylabel)
 
 
 def evaluate_data(data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, t, m, n):
@@ -107,16 +96,9 @@ def normalize_wait_time_punishment(wait_time_punishment, cars_amount, t):
 
 
 def main():
-    """Main function to load data and generate plots."""
-    data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time, data_best = load_data()
-
-    plot_score(data_moving, data_not_reaching, data_wait_punishment, data_avg_wait_time)
-    plot_data(data_moving, '#87CEFA',  'General Traffic Flow', 'Number Of Cars That Moved')
-    plot_data(data_not_reaching, '#B2D8D8', 'How Many Cars Were Late', 'Number Of Cars')
-    plot_data(data_wait_punishment, '#98FB98', 'Car Starvation Punishment', 'Average Car Starvation Punishment')
-    plot_data(data_avg_wait_time, '#FFA07A', 'Average Car Wait Time', 'Average Time')
+    """Plot the run log of a PPO training run, redrawn while the run goes on."""
+    follow(sys.argv[1] if len(sys.argv) > 1 else log_directory, draw)
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,6 +1,7 @@
 import numpy as np
 from Model.Direction import Direction
 from Model.Reporter import Reporter
+from Model.Solution import SOLUTION_DTYPE
 from Solvers.Solver import Solver
 
 
@@ -14,13 +15,13 @@ class BaseLineSolver(Solver):
         in an mxm matrix for t time steps using vectorized operations.
 
         Returns:
-        - np.ndarray: A (t, n, m) array where each element is either Direction.HORIZONTAL or Direction.VERTICAL.
+        - np.ndarray: A (t, n, m) uint8 array of Direction values, see Model.Solution.
         """
-        solution = np.empty((self.t, self.n, self.m), dtype=object)
+        solution = np.empty((self.t, self.n, self.m), dtype=SOLUTION_DTYPE)
 
         # Create a base (n, m) matrix for each direction
-        horizontal_matrix = np.full((self.n, self.m), Direction.HORIZONTAL)
-        vertical_matrix = np.full((self.n, self.m), Direction.VERTICAL)
+        horizontal_matrix = np.full((self.n, self.m), Direction.HORIZONTAL.value)
+        vertical_matrix = np.full((self.n, self.m), Direction.VERTICAL.value)
 
         # Assign horizontal to even time steps and vertical to odd time steps
         solution[0::2] = horizontal_matrix
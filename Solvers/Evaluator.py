@@ -0,0 +1,202 @@
+import multiprocessing as mp
+import os
+from abc import ABC, abstractmethod
+from multiprocessing import shared_memory
+from typing import List, Dict, Tuple, Optional
+import numpy as np
+from Model.ArrayEngine import ArrayEngine
+from Model.City import City
+from Model.Solution import pack_solutions, unpack_solutions
+
+# Maximum number of solutions simulated together, bounds the memory of the stacked simulation state.
+EVALUATION_BATCH_SIZE = 100
+# Maximum number of cars (solutions x cities x cars per city) simulated together. A simulated car takes about 150
+# bytes of engine state and tick temporaries, so a batch stays within a few hundred MB whatever the city size.
+EVALUATION_MAX_CARS = 2000000
+
+# The scenarios engine of a pool worker, built once from shared memory by init_worker.
+_worker_engine: Optional[ArrayEngine] = None
+_worker_memory: List[shared_memory.SharedMemory] = []
+
+
+class Evaluator(ABC):
+    """
+    Simulates populations of solutions over a fixed set of cities.
+    The cities are given once per run with set_cities, then only solution arrays are sent to simulate, which
+    returns the raw evaluation metrics of each solution.
+    """
+
+    def __init__(self, batch_size: int = EVALUATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.cities_amount = 0
+        # The number of solutions simulated together, batch_size capped by the cars of the cities, see set_batch_cars
+        self.solutions_per_batch = batch_size
+
+    def set_batch_cars(self, cars_per_solution: int) -> None:
+        """Cap the solutions simulated together so a batch holds at most EVALUATION_MAX_CARS cars."""
+        self.solutions_per_batch = max(1, min(self.batch_size, EVALUATION_MAX_CARS // max(cars_per_solution, 1)))
+
+    @abstractmethod
+    def set_cities(self, cities: List[City]) -> None:
+        """Set the cities that the next populations are simulated on."""
+        pass
+
+    @abstractmethod
+    def simulate(self, solutions: np.ndarray) -> np.ndarray:
+        """
+        Simulate every solution over all the cities.
+        :param solutions: A (P, t, n, m) array of solutions.
+        :return: A (4, P) array with the not reaching cars, total average wait time, car movements and wait time
+            punishment of each solution, summed over the cities (the arguments order of Solver.evaluate).
+        """
+        pass
+
+    def close(self) -> None:
+        """Release the resources held by the evaluator."""
+        pass
+
+
+class SerialEvaluator(Evaluator):
+    """Simulates the solutions in the current process, solutions_per_batch solutions at a time."""
+
+    def __init__(self, batch_size: int = EVALUATION_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.engine: Optional[ArrayEngine] = None
+
+    def set_cities(self, cities: List[City]) -> None:
+        self.engine = ArrayEngine.from_cities(cities)
+        self.cities_amount = len(cities)
+        self.set_batch_cars(len(self.engine.car_sims))
+
+    def simulate(self, solutions: np.ndarray) -> np.ndarray:
+        metrics = [self.engine.simulate_solutions(solutions[start:start + self.solutions_per_batch])
+                   for start in range(0, len(solutions), self.solutions_per_batch)]
+        return np.concatenate(metrics, axis=1)
+
+
+class PrefixSharingEvaluator(Evaluator):
+    """
+    Simulates solutions that share their first ticks only once.
+    The population is walked as a prefix trie over the time steps: every lane of the engine is a distinct prefix
+    (with a simulation per city), and when the solutions of a lane differ at the next tick the lane state is
+    copied into one branch per distinct assignment. With elitism and low mutation rates most children share long
+    prefixes with their parents or each other, so far fewer ticks are simulated.
+    The solutions are sorted before being cut into batches, so solutions with common prefixes share a batch.
+    """
+
+    def __init__(self, batch_size: int = EVALUATION_BATCH_SIZE):
+        super().__init__(batch_size)
+        self.engine: Optional[ArrayEngine] = None
+        # The number of (prefix, tick) pairs simulated, against the solutions * ticks a plain evaluation runs
+        self.simulated_ticks = 0
+        self.requested_ticks = 0
+
+    def set_cities(self, cities: List[City]) -> None:
+        self.engine = ArrayEngine.from_cities(cities)
+        self.cities_amount = len(cities)
+        self.set_batch_cars(len(self.engine.car_sims))
+
+    def simulate(self, solutions: np.ndarray) -> np.ndarray:
+        solutions = ArrayEngine.to_light_states(solutions)
+        packed = np.packbits(solutions.reshape(len(solutions), -1), axis=1)
+        _, ranks = np.unique(packed, axis=0, return_inverse=True)
+        order = np.argsort(ranks.reshape(-1), kind='stable')
+
+        metrics = np.empty((4, len(solutions)))
+        for start in range(0, len(solutions), self.solutions_per_batch):
+            batch = order[start:start + self.solutions_per_batch]
+            metrics[:, batch] = self.simulate_trie(solutions[batch])
+        return metrics
+
+    def simulate_trie(self, solutions: np.ndarray) -> np.ndarray:
+        """
+        Simulate a batch of solutions, branching the shared prefixes tick by tick.
+        :param solutions: A (P, t, n, m) uint8 array of solutions.
+        :return: The (4, P) metrics of the solutions.
+        """
+        cities_amount = self.engine.num_sims
+        engine = self.engine.tile(1)
+        lanes = np.zeros(len(solutions), dtype=np.int64)
+        for t in range(solutions.shape[1]):
+            if engine.is_drained():
+                break
+            # Split every lane by the assignment its solutions take at this tick
+            keys = np.column_stack((lanes, np.packbits(solutions[:, t].reshape(len(solutions), -1), axis=1)))
+            _, first_solutions, new_lanes = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+            new_lanes = new_lanes.reshape(-1)
+            parent_lanes = lanes[first_solutions]
+            if len(parent_lanes) != engine.num_sims // cities_amount:
+                sims = (parent_lanes[:, None] * cities_amount + np.arange(cities_amount)).reshape(-1)
+                engine = engine.select(sims)
+            engine.update(np.repeat(solutions[first_solutions, t], cities_amount, axis=0))
+            lanes = new_lanes
+            self.simulated_ticks += len(first_solutions)
+        self.requested_ticks += solutions.shape[0] * solutions.shape[1]
+        return engine.get_metrics(cities_amount)[:, lanes]
+
+
+class ProcessPoolEvaluator(Evaluator):
+    """
+    Simulates the solutions on a pool of persistent worker processes.
+    The scenario arrays are written once into shared memory by set_cities and every worker maps them, so a
+    generation only ships the solutions (bit-packed, a bit per light) and the metrics back.
+    """
+
+    def __init__(self, num_workers: int = None, batch_size: int = EVALUATION_BATCH_SIZE):
+        """
+        :param num_workers: The number of worker processes, defaults to the number of CPUs.
+        :param batch_size: The maximum number of solutions a worker simulates together.
+        """
+        super().__init__(batch_size)
+        self.num_workers = num_workers or os.cpu_count()
+        self.pool = None
+        self.memory: List[shared_memory.SharedMemory] = []
+
+    def set_cities(self, cities: List[City]) -> None:
+        self.close()
+        engine = ArrayEngine.from_cities(cities)
+        specs = {}
+        for name, array in engine.get_static_arrays().items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.memory.append(block)
+            specs[name] = (block.name, array.shape, array.dtype.str)
+
+        self.cities_amount = len(cities)
+        self.set_batch_cars(len(engine.car_sims))
+        self.pool = mp.Pool(self.num_workers, initializer=init_worker,
+                            initargs=(engine.n, engine.m, engine.num_sims, specs))
+
+    def simulate(self, solutions: np.ndarray) -> np.ndarray:
+        packed, shape = pack_solutions(solutions)
+        chunk_size = min(self.solutions_per_batch, -(-len(solutions) // self.num_workers))
+        chunks = [(packed[start:start + chunk_size], (min(chunk_size, len(packed) - start), *shape[1:]))
+                  for start in range(0, len(packed), chunk_size)]
+        return np.concatenate(self.pool.map(simulate_chunk, chunks), axis=1)
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        for block in self.memory:
+            block.close()
+            block.unlink()
+        self.memory = []
+
+
+def init_worker(n: int, m: int, num_sims: int, specs: Dict[str, Tuple[str, tuple, str]]) -> None:
+    """Build the scenarios engine of a pool worker on top of the shared memory blocks."""
+    global _worker_engine
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _worker_memory.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    _worker_engine = ArrayEngine.from_static_arrays(n, m, num_sims, arrays)
+
+
+def simulate_chunk(chunk: Tuple[np.ndarray, Tuple[int, ...]]) -> np.ndarray:
+    """Simulate a chunk of bit-packed solutions and their shape on the worker engine, see Evaluator.simulate."""
+    return _worker_engine.simulate_solutions(unpack_solutions(*chunk))
@@ -0,0 +1,79 @@
+import hashlib
+import itertools
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+import numpy as np
+from Model.City import City
+
+# The default number of solutions whose metrics are kept, a (4,) metrics row and a 16 bytes digest each
+FITNESS_CACHE_SIZE = 100000
+# The number of metrics of a solution, see Evaluator.simulate
+NUM_METRICS = 4
+
+# Unseeded city sets can't be recognized from their content, each one gets a new identity
+_unseeded_city_sets = itertools.count()
+
+
+def city_set_identity(cities: List[City]) -> Hashable:
+    """
+    Identify a set of cities. Cities generated from a seed are rebuilt identically from it, so seeded city sets are
+    identified by their seeds and sizes, any other set only matches itself.
+    """
+    seeds = [None if city.scenario is None else city.scenario.seed for city in cities]
+    if any(seed is None for seed in seeds):
+        return 'unseeded', next(_unseeded_city_sets)
+    return tuple((city.n, city.m, len(city.cars), seed.entropy, tuple(seed.spawn_key))
+                 for city, seed in zip(cities, seeds))
+
+
+class FitnessCache:
+    """
+    A bounded LRU cache of the raw evaluation metrics of solutions, see Evaluator.simulate.
+    Solutions are keyed by a digest of their bytes and the identity of the city set they were simulated on. The
+    elite kept by a genetic algorithm and the duplicate children of identical parents are then simulated only once,
+    and the metrics breakdown of a cached solution can be reported without simulating it again.
+    """
+
+    def __init__(self, max_size: int = FITNESS_CACHE_SIZE):
+        """
+        :param max_size: The maximum number of cached solutions, the least recently used ones are evicted first.
+            0 disables the cache.
+        """
+        self.max_size = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.cities_identity: Optional[Hashable] = None
+        self.hits = 0
+        self.misses = 0
+
+    def set_cities(self, cities: List[City]) -> None:
+        """Set the cities of the next lookups, like Evaluator.set_cities."""
+        self.cities_identity = city_set_identity(cities)
+
+    def keys(self, solutions: np.ndarray) -> List[Tuple[Hashable, bytes]]:
+        """Return the cache keys of a (P, t, n, m) array of solutions."""
+        rows = np.ascontiguousarray(solutions).reshape(len(solutions), -1)
+        return [(self.cities_identity, hashlib.blake2b(row, digest_size=16).digest()) for row in rows]
+
+    def get(self, key: Tuple[Hashable, bytes]) -> Optional[np.ndarray]:
+        """Return the cached (4,) metrics of a key, None if it is not cached."""
+        metrics = self.entries.get(key)
+        if metrics is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return metrics
+
+    def put(self, key: Tuple[Hashable, bytes], metrics: np.ndarray) -> None:
+        """Cache the (4,) metrics of a key, evicting the least recently used entries beyond max_size."""
+        if self.max_size <= 0:
+            return
+        self.entries[key] = metrics
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
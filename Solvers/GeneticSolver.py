@@ -1,9 +1,13 @@
 import numpy as np
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import matplotlib.pyplot as plt
 from Model.City import City
-from Model.Direction import Direction
+from Model.Instrumentation import INSTRUMENTATION
 from Model.Reporter import Reporter
+from Model.ScenarioGenerator import Seed
+from Model.Solution import SOLUTION_DTYPE
+from Solvers.Evaluator import Evaluator, SerialEvaluator
+from Solvers.FitnessCache import FitnessCache, FITNESS_CACHE_SIZE, NUM_METRICS
 from Solvers.Solver import Solver
 
 
@@ -14,17 +18,27 @@ class GeneticSolver(Solver):
     """
 
     def __init__(self, population_size: int, mutation_rate: float, generations: int, n: int, m: int, t: int,
-                 reporter: Reporter):
+                 reporter: Reporter, evaluator: Evaluator = None, cache_size: int = FITNESS_CACHE_SIZE):
         """
         Initializes the GeneticSolver with the necessary parameters.
         - population_size (int): The number of solutions in each generation's population.
         - mutation_rate (float): The probability of a mutation occurring at each gene in a solution.
         - generations (int): The number of generations to evolve the population.
+        - evaluator (Evaluator): Simulates the populations, a SerialEvaluator by default. Use a
+          ProcessPoolEvaluator to spread the simulations over all the cores.
+        - cache_size (int): The number of solutions whose metrics are cached, so the elite and duplicate children
+          are not simulated again. 0 disables the cache.
         """
         super().__init__(n, m, t, reporter)
         self.population_size = population_size
         self.mutation_rate = mutation_rate
         self.generations = generations
+        self.evaluator = evaluator if evaluator is not None else SerialEvaluator()
+        self.fitness_cache = FitnessCache(cache_size)
+        # Two (P, t, n, m) populations, the current one and the one the next children are written to, allocated by
+        # initialize_population
+        self.population_buffers: Optional[np.ndarray] = None
+        self.current_population = 0
 
     def generate_random_solution(self) -> np.ndarray:
         """
@@ -32,66 +46,94 @@ class GeneticSolver(Solver):
         (Horizontal or Vertical) for each junction at each time step.
 
         Returns:
-        - np.ndarray: A (t, n, m) array where each element is either Direction.HORIZONTAL or Direction.VERTICAL.
+        - np.ndarray: A (t, n, m) uint8 array of Direction values, see Model.Solution.
         """
-        return np.random.choice([Direction.HORIZONTAL, Direction.VERTICAL], size=(self.t, self.n, self.m))
+        return np.random.randint(0, 2, size=(self.t, self.n, self.m), dtype=SOLUTION_DTYPE)
 
-    def uniform_crossover(self, parent1: np.ndarray, parent2: np.ndarray) -> np.ndarray:
+    def random_bits(self, count: int) -> np.ndarray:
         """
-        Performs uniform crossover between two parent solutions to produce a child solution.
+        Draws count solutions of random bits, each gene 0 or 1 with a 50% chance.
+        The bits are drawn a byte at a time and unpacked, eight genes per random number.
+
+        Returns:
+        - np.ndarray: A (count, t, n, m) uint8 array of zeros and ones.
+        """
+        genes = self.t * self.n * self.m
+        random_bytes = np.random.randint(0, 256, size=(count, (genes + 7) // 8), dtype=np.uint8)
+        return np.unpackbits(random_bytes, axis=1, count=genes).reshape(count, self.t, self.n, self.m)
+
+    def uniform_crossover(self, parents1: np.ndarray, parents2: np.ndarray, children: np.ndarray) -> np.ndarray:
+        """
+        Performs uniform crossover between pairs of parent solutions, each gene of a child coming from either
+        parent with a 50% chance.
 
         Parameters:
-        - parent1 (np.ndarray): The first parent solution.
-        - parent2 (np.ndarray): The second parent solution.
+        - parents1 (np.ndarray): The (k, t, n, m) first parents.
+        - parents2 (np.ndarray): The (k, t, n, m) second parents.
+        - children (np.ndarray): The (k, t, n, m) array the children are written to.
 
         Returns:
-        - np.ndarray: A new child solution generated by combining parts of parent1 and parent2.
+        - np.ndarray: The children.
         """
-        mask = np.random.rand(*parent1.shape) < 0.5  # Create a mask with 50% chance for each gene
-        child = np.where(mask, parent1, parent2)  # Choose genes from parent1 or parent2 based on mask
-        return child
+        # The genes are 0 and 1, so taking the genes of parent1 where the mask is set is parent2 ^ (diff & mask)
+        np.bitwise_xor(parents1, parents2, out=children)
+        children &= self.random_bits(len(children))
+        children ^= parents2
+        return children
 
-    def mutate(self, solution: np.ndarray) -> np.ndarray:
+    def mutate(self, solutions: np.ndarray) -> np.ndarray:
         """
-        Mutates a given solution by flipping the direction of traffic lights at random locations based on the
+        Mutates solutions in place by flipping the direction of traffic lights at random locations based on the
         mutation rate.
+        Instead of a random number per gene, the number of mutations is drawn from the binomial distribution and
+        their locations uniformly, a location drawn twice is flipped once.
 
         Parameters:
-        - solution (np.ndarray): The solution to be mutated.
+        - solutions (np.ndarray): The contiguous solutions to be mutated, of any shape.
 
         Returns:
-        - np.ndarray: The mutated solution.
+        - np.ndarray: The mutated solutions.
         """
-        mutation_mask = np.random.random(solution.shape) < self.mutation_rate
-        # Directly flip the directions using boolean indexing
-        solution[mutation_mask & (solution == Direction.HORIZONTAL)] = Direction.VERTICAL
-        solution[mutation_mask & (solution == Direction.VERTICAL)] = Direction.HORIZONTAL
-        return solution
+        genes = solutions.reshape(-1)
+        mutations = np.random.binomial(genes.size, self.mutation_rate)
+        # The directions are 0 and 1, so flipping is a single xor
+        genes[np.random.randint(0, genes.size, size=mutations)] ^= 1
+        return solutions
 
-    def create_children(self, parents: np.ndarray) -> np.ndarray:
+    def create_children(self, population: np.ndarray, parents: np.ndarray) -> np.ndarray:
         """
         Creates a new population of offspring by performing crossover and mutation on the parent solutions.
+        Every pair of distinct parents gives two children, made at once for the whole population in the population
+        buffer that doesn't hold the current population. That buffer then becomes the current one.
 
         Parameters:
-        - parents (np.ndarray): The parent solutions selected for reproduction.
+        - population (np.ndarray): The current population.
+        - parents (np.ndarray): The population indices of the parents selected for reproduction.
 
         Returns:
         - np.ndarray: A new population of offspring solutions.
         """
-        children = np.empty((self.population_size, self.t, self.n, self.m), dtype=object)
-        for i in range(0, self.population_size, 2):
-            parent1, parent2 = np.random.choice(len(parents), 2, replace=False)
-            child1 = self.uniform_crossover(parents[parent1], parents[parent2])
-            child2 = self.uniform_crossover(parents[parent2], parents[parent1])
-            children[i, :, :, :] = self.mutate(child1)
-            children[i + 1, :, :, :] = self.mutate(child2)
-
-        return children
+        self.current_population = 1 - self.current_population
+        children = self.population_buffers[self.current_population]
+        pairs = (self.population_size + 1) // 2
+        first = np.random.randint(0, len(parents), size=pairs)
+        # Drawn from the other len(parents) - 1 parents, so the two parents of a pair are distinct
+        second = np.random.randint(0, len(parents) - 1, size=pairs)
+        second += second >= first
+        parents1 = population[parents[first]]
+        parents2 = population[parents[second]]
+        self.uniform_crossover(parents1, parents2, children[:pairs])
+        second_children = self.population_size - pairs
+        self.uniform_crossover(parents2[:second_children], parents1[:second_children], children[pairs:])
+        return self.mutate(children)
 
     def tournament_selection(self, population: np.ndarray, fitness_scores: np.ndarray,
                              tournament_size: int = 50) -> np.ndarray:
         """
         Selects parents using tournament selection.
+        The winner of a tournament between tournament_size distinct solutions is the best one, so the solution
+        ranked r (0 for the best) wins with the probability that it is drawn and the r better ones are not. The
+        winners of all the tournaments are drawn at once from that distribution over the ranks.
 
         Parameters:
         - population (np.ndarray): The current population of solutions.
@@ -99,18 +141,29 @@ class GeneticSolver(Solver):
         - tournament_size (int): The number of individuals in each tournament.
 
         Returns:
-        - np.ndarray: The selected parent solutions.
+        - np.ndarray: The population indices of the selected parents.
         """
-        selected_parents = []
-        for _ in range(self.population_size):
-            tournament_indices = np.random.choice(len(population), size=tournament_size, replace=False)
-            tournament_fitness = fitness_scores[tournament_indices]
-            best_index = tournament_indices[np.argmax(tournament_fitness)]
-            selected_parents.append(population[best_index])
-
-        return np.array(selected_parents)
+        ranking = np.argsort(-fitness_scores, kind='stable')
+        winners = np.random.choice(len(population), size=self.population_size,
+                                   p=self.tournament_win_probabilities(len(population), tournament_size))
+        return ranking[winners]
 
-    def solve(self, num_cities: int, num_cars: int) -> np.ndarray:
+    @staticmethod
+    def tournament_win_probabilities(population_size: int, tournament_size: int) -> np.ndarray:
+        """
+        Returns the probability of every rank to win a tournament, C(N - 1 - r, k - 1) / C(N, k) for the rank r
+        in a population of N with tournaments of k.
+        """
+        if tournament_size > population_size:
+            raise ValueError("Tournament size must not exceed the population size")
+        ranks = np.arange(population_size - tournament_size)
+        # C(N - 2 - r, k - 1) / C(N - 1 - r, k - 1) = (N - r - k) / (N - 1 - r)
+        ratios = (population_size - ranks - tournament_size) / (population_size - 1 - ranks)
+        probabilities = np.concatenate(([1.0], np.cumprod(ratios)))
+        probabilities = np.concatenate((probabilities, np.zeros(population_size - len(probabilities))))
+        return probabilities / probabilities.sum()
+
+    def solve(self, num_cities: int, num_cars: int, seed: Seed = None) -> np.ndarray:
         """
         Runs the genetic algorithm to find the optimal traffic light configuration that minimizes average car waiting times.
         For each generation, it creates new random cities to evaluate the solutions.
@@ -118,45 +171,97 @@ class GeneticSolver(Solver):
         Parameters:
         - num_cities (int): The number of cities to generate and evaluate for each generation.
         - num_cars (int): The number of cars to simulate in each city.
+        - seed (Seed): The seed of the cities, see City.generate_cities.
 
         Returns:
         - np.ndarray: The best solution found after all generations.
         """
         population = self.initialize_population()
-        cities = self.generate_cities_for_generation(num_cities, num_cars)
-        for generation in range(self.generations):
-            fitness_scores = self.evaluate_population(population, cities)
-            best_solution, best_fitness = self.find_best_solution(population, fitness_scores)
-
-            print(f"Generation {generation + 1}: Best fitness = {best_fitness}")
-
-            parents = self.tournament_selection(population, fitness_scores)
-            children = self.create_children(parents)
-            population = self.add_best_to_children(children, best_solution)
-            self.report_best_solution(best_solution, cities)
-            self.reporter.record_best_solutions_scores(best_fitness, best_solution)
-
-        best_final_solution, best_final_fitness = self.find_best_solution(population, fitness_scores)
-        self.reporter.record_best_solutions_scores(best_final_fitness, best_final_solution)
+        try:
+            with INSTRUMENTATION.phase('city_generation'):
+                cities = self.generate_cities_for_generation(num_cities, num_cars, seed)
+                self.evaluator.set_cities(cities)
+                self.fitness_cache.set_cities(cities)
+            for generation in range(self.generations):
+                with INSTRUMENTATION.phase('evaluation'):
+                    fitness_scores, metrics = self.evaluate_population(population, cities)
+                best_solution, best_fitness = self.find_best_solution(population, fitness_scores)
+                best_metrics = metrics[:, np.argmax(fitness_scores)]
+
+                print(f"Generation {generation + 1}: Best fitness = {best_fitness}")
+
+                with INSTRUMENTATION.phase('selection'):
+                    parents = self.tournament_selection(population, fitness_scores)
+                with INSTRUMENTATION.phase('crossover'):
+                    children = self.create_children(population, parents)
+                with INSTRUMENTATION.phase('elitism'):
+                    population = self.add_best_to_children(children, best_solution)
+                with INSTRUMENTATION.phase('reporting'):
+                    self.report_best_solution(best_metrics, cities)
+                    self.reporter.record_best_solutions_scores(best_fitness, best_solution)
+
+            best_final_solution, best_final_fitness = self.find_best_solution(population, fitness_scores)
+            self.reporter.record_best_solutions_scores(best_final_fitness, best_final_solution)
+        finally:
+            # Also on errors and interrupts, so the pool processes and shared memory of the evaluator are released
+            self.evaluator.close()
 
         print(f"Final Best Fitness: {best_final_fitness}")
+        INSTRUMENTATION.report('GeneticSolver.solve')
 
-        return best_final_solution
+        # A copy, the population buffers are reused by the next run
+        return best_final_solution.copy()
 
-    def report_best_solution(self, best_solution, cities):
-        self.evaluate_solution(best_solution, cities, report=True)
+    def report_best_solution(self, best_metrics: np.ndarray, cities: List[City]):
+        """
+        Record the metrics of the best solution, as returned by the evaluator or the fitness cache, in the Reporter.
+        The solution is not simulated again.
+        """
+        self.evaluate_metrics(best_metrics, cities, report=True)
 
     def initialize_population(self) -> np.ndarray:
-        """Initializes the population with random solutions."""
-        return np.array([self.generate_random_solution() for _ in range(self.population_size)])
-
-    def generate_cities_for_generation(self, num_cities: int, num_cars: int) -> list:
+        """Initializes the population buffers, the current population with random solutions."""
+        self.population_buffers = np.empty((2, self.population_size, self.t, self.n, self.m), dtype=SOLUTION_DTYPE)
+        self.current_population = 0
+        population = self.population_buffers[self.current_population]
+        population[:] = self.random_bits(self.population_size)
+        return population
+
+    def generate_cities_for_generation(self, num_cities: int, num_cars: int, seed: Seed = None) -> list:
         """Generates a new set of random cities for this generation."""
-        return City.generate_cities(self.n, self.m, num_cars, num_cities)
+        return City.generate_cities(self.n, self.m, num_cars, num_cities, seed=seed)
 
-    def evaluate_population(self, population: np.ndarray, cities: List[City]) -> np.ndarray:
-        """Evaluates the fitness of each solution in the population."""
-        return np.array([self.evaluate_solution(solution, cities) for solution in population])
+    def evaluate_population(self, population: np.ndarray, cities: List[City]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Evaluates the fitness of each solution in the population with the evaluator. The evaluator and the fitness
+        cache must have been given the cities with set_cities. Only the solutions that are not cached are simulated,
+        each distinct one once.
+
+        Returns:
+        - Tuple[np.ndarray, np.ndarray]: The fitness scores and the (4, P) raw metrics of the solutions.
+        """
+        metrics = np.empty((NUM_METRICS, len(population)))
+        keys = self.fitness_cache.keys(population)
+        # The population index of every distinct solution to simulate, and the indices sharing its metrics
+        missing: Dict[tuple, List[int]] = {}
+        for index, key in enumerate(keys):
+            if key in missing:
+                missing[key].append(index)
+                continue
+            cached = self.fitness_cache.get(key)
+            if cached is None:
+                missing[key] = [index]
+            else:
+                metrics[:, index] = cached
+        if missing:
+            first_indices = [indices[0] for indices in missing.values()]
+            simulated = self.evaluator.simulate(population[first_indices])
+            for column, (key, indices) in enumerate(missing.items()):
+                metrics[:, indices] = simulated[:, column:column + 1]
+                self.fitness_cache.put(key, simulated[:, column].copy())
+        INSTRUMENTATION.count('solutions_evaluated', len(missing))
+        INSTRUMENTATION.count('fitness_cache_hits', len(population) - sum(map(len, missing.values())))
+        return self.evaluate_metrics(metrics, cities), metrics
 
     def find_best_solution(self, population: np.ndarray, fitness_scores: np.ndarray) -> tuple:
         """Finds the best solution and its fitness in the current population."""
@@ -164,8 +269,6 @@ class GeneticSolver(Solver):
         return population[best_index], fitness_scores[best_index]
 
     def add_best_to_children(self, children: np.ndarray, best_solution: np.ndarray) -> np.ndarray:
-        """replace a random children with the best solution."""
-        random_index = np.random.randint(0, len(children))
-        return np.concatenate(
-            (children[:random_index], children[random_index + 1:], best_solution.reshape(1, self.t, self.n, self.m)))
-
+        """Replace a random child with the best solution, in place."""
+        children[np.random.randint(0, len(children))] = best_solution
+        return children
@@ -1,13 +1,19 @@
+import multiprocessing as mp
 import random
 from itertools import product
-from typing import List, Tuple
+from multiprocessing.connection import Connection
+from typing import List, Tuple, Optional
 import numpy as np
+import torch as T
 
 from Model.City import City, Neighborhood
 from Model.Coordinate import Coordinate
 from Model.Direction import Direction
+from Model.Instrumentation import INSTRUMENTATION
+from Model.Solution import SOLUTION_DTYPE
 from PPO.Agent import Agent
 from Model.Reporter import Reporter
+from Model.ScenarioGenerator import ScenarioGenerator, Seed
 from Solvers.Solver import Solver
 
 # The value is 4 because:
@@ -35,6 +41,9 @@ NUM_OF_EPOCHS = 5
 NUM_OF_SIMULATIONS = 6
 MAX_ITERATIONS = 100
 
+# The first ticks of a training city are driven by random assignments only, to fill the city with cars.
+WARMUP_TICKS = 8
+
 
 class PPOSolver(Solver):
     """
@@ -57,6 +66,11 @@ class PPOSolver(Solver):
         """
         super().__init__(n, m, t, reporter)
         self.all_actions = self.init_all_actions()
+        # All the actions stacked, for voting on whole batches of actions at once
+        self.action_values = np.array(self.all_actions)
+        # The number of neighborhoods that vote on every junction
+        self.vote_counts = self.count_votes(np.zeros((1, self.neighborhood_count()), dtype=np.int64),
+                                            np.ones((1, NEIGHBORHOOD_N, NEIGHBORHOOD_M), dtype=np.uint8))[0]
         self.agent = self.init_agent()
 
     def init_agent(self) -> Agent:
@@ -73,11 +87,12 @@ class PPOSolver(Solver):
         Initializes all possible traffic light configurations for neighborhoods.
 
         Returns:
-            List[np.ndarray]: A list of all possible configurations.
+            List[np.ndarray]: A list of all possible configurations, as uint8 Direction values.
         """
-        possible_combinations = list(product([Direction.HORIZONTAL, Direction.VERTICAL],
+        possible_combinations = list(product([Direction.HORIZONTAL.value, Direction.VERTICAL.value],
                                              repeat=NEIGHBORHOOD_M * NEIGHBORHOOD_M))
-        return [np.array(combination).reshape(NEIGHBORHOOD_N, NEIGHBORHOOD_M) for combination in possible_combinations]
+        return [np.array(combination, dtype=SOLUTION_DTYPE).reshape(NEIGHBORHOOD_N, NEIGHBORHOOD_M)
+                for combination in possible_combinations]
 
     def solve(self, city: City) -> np.ndarray:
         """
@@ -89,24 +104,52 @@ class PPOSolver(Solver):
         Returns:
             np.ndarray: The optimal traffic light configuration for each time step.
         """
-        counter = 0
-        solution = []
+        solution = self.solve_cities([city])[0]
+        INSTRUMENTATION.report('PPOSolver.solve')
+        return solution
+
+    def solve_cities(self, cities: List[City], deterministic: bool = False) -> np.ndarray:
+        """
+        Solves several cities together. Every tick, the states of all the neighborhoods of all the cities are
+        stacked into one batch and the agent chooses all their actions with a single forward pass.
+
+        Args:
+            cities (List[City]): The cities to optimize, all of them n x m.
+            deterministic (bool): Take the most probable action of every neighborhood instead of sampling it.
+
+        Returns:
+            np.ndarray: A (cities, t, n, m) array of the traffic light configuration of every city for each time step.
+        """
+        solutions = np.empty((len(cities), self.t, self.n, self.m), dtype=SOLUTION_DTYPE)
 
         for t in range(self.t):
-            actions_for_current_tick = []
-            for i in range(self.n - NEIGHBORHOOD_N + 1):
-                for j in range(self.m - NEIGHBORHOOD_M + 1):
-                    top_left, top_right, bottom_left = self.build_neighborhood_coords(i, j)
-                    neighborhood = city.get_neighborhood(top_left, top_right, bottom_left)
-                    action, _, _ = self.agent.choose_action(neighborhood.get_state())
-                    actions_for_current_tick.append(action)
-
-            assignment = self.vote_on_assignment(actions_for_current_tick)
-            solution.append(assignment)
-            city.update_city(assignment)
+            with INSTRUMENTATION.phase('neighborhood_states'):
+                states = np.concatenate([self.get_neighborhood_states(city) for city in cities])
+            with INSTRUMENTATION.phase('choose_actions'):
+                actions = self.agent.choose_actions(states, deterministic).reshape(len(cities), -1)
+            with INSTRUMENTATION.phase('vote'):
+                assignments = self.vote_on_assignments(actions)
+            for city, assignment, solution in zip(cities, assignments, solutions):
+                solution[t] = assignment
+                city.update_city(assignment)
 
-        city.reset_city()
-        return np.array(solution)
+        for city in cities:
+            city.reset_city()
+        return solutions
+
+    def get_neighborhood_states(self, city: City) -> np.ndarray:
+        """
+        Return the states of all the neighborhoods of a city, in row major order of their top left corner.
+
+        Args:
+            city (City): The city to observe.
+
+        Returns:
+            np.ndarray: A (neighborhoods, state_dims) array.
+        """
+        views = city.get_neighborhood_views(NEIGHBORHOOD_N, NEIGHBORHOOD_M)
+        INSTRUMENTATION.count('neighborhood_states', self.neighborhood_count())
+        return views.reshape(self.neighborhood_count(), -1)
 
     def neighborhood_count(self):
         """
@@ -117,15 +160,25 @@ class PPOSolver(Solver):
         """
         return (self.n - NEIGHBORHOOD_N + 1) * (self.m - NEIGHBORHOOD_M + 1)
 
-    def train(self, num_cities: int, num_cars: int) -> None:
+    def train(self, num_cities: int, num_cars: int, num_workers: int = 1, sync_interval: int = 1,
+              seed: Seed = None) -> None:
         """
        Trains the PPO agent on a set of generated cities.
 
        Args:
            num_cities (int): The number of cities to generate for training.
            num_cars (int): The number of cars in each city.
+           num_workers (int): The number of rollout worker processes, see train_parallel. A single worker trains
+               in the current process.
+           sync_interval (int): The number of ticks between two weight updates of the workers.
+           seed (Seed): The seed of the training cities, see City.generate_cities.
        """
-        cities = City.generate_cities(self.n, self.m, num_cars, num_cities)
+        if num_workers > 1:
+            self.train_parallel(num_cities, num_cars, num_workers, sync_interval, seed)
+            INSTRUMENTATION.report('PPOSolver.train')
+            return
+
+        cities = City.generate_cities(self.n, self.m, num_cars, num_cities, seed=seed)
         best_score = float('-inf')
         scores = []
 
@@ -133,41 +186,130 @@ class PPOSolver(Solver):
             total_score = 0
             print(f"starting to going over city number {index + 1} out of {len(cities)}")
             for t in range(self.t):
-                if t < 8:
-                    city.update_city(np.random.choice(list(Direction), size=(self.n, self.m)))
-                    continue
-
-                neighborhood = self.get_random_neighborhood(city)
-                while neighborhood.original_num_of_cars == 0:
-                    neighborhood = self.get_random_neighborhood(city)
-                # city.print(np.random.choice(list(Direction), size=(self.n, self.m)))
-                counter = 0
-                total_reward = 0
-                done = False
-                while not done:
-                    counter += 1
-                    reward, done = self.neighborhood_iteration(neighborhood, counter)
-                    total_reward += reward
-
-                total_score += total_reward / counter
-
-                self.agent.learn()
-                assignment = np.random.choice(list(Direction), size=(self.n, self.m))
-                city.update_city(assignment)
+                with INSTRUMENTATION.phase('collect_experience'):
+                    score = self.collect_tick_experience(city, t)
+                if score is not None:
+                    total_score += score
+                    with INSTRUMENTATION.phase('learn'):
+                        self.agent.learn()
+                city.update_city(self.random_assignment())
 
             print(f"The score for city {index} is: {total_score / self.t}")
             scores.append(total_score / self.t)
-            city.reset_city()
-            solution = self.solve(city)
-            self.reporter.record_best_solutions_scores(self.evaluate_solution(solution, [city], report=True),
-                                                       solution)
+            with INSTRUMENTATION.phase('finish_training_city'):
+                self.finish_training_city(city)
             if scores[-1] > best_score:
                 self.agent.save_models()
                 best_score = scores[-1]
+        INSTRUMENTATION.report('PPOSolver.train')
+
+    def train_parallel(self, num_cities: int, num_cars: int, num_workers: int, sync_interval: int = 1,
+                       seed: Seed = None) -> None:
+        """
+        Trains the PPO agent with rollout worker processes. Every worker owns a contiguous slice of the training
+        cities and its own copy of the agent networks. Each round, every worker runs one tick of its current city
+        and sends back the experiences it collected, then this process learns from all of them. The workers get
+        the new weights every sync_interval rounds. The workers only get the seeds of their cities and build them
+        locally, the cities are the same ones train builds from the seed.
+
+        Args:
+            num_cities (int): The number of cities to generate for training.
+            num_cars (int): The number of cars in each city.
+            num_workers (int): The number of worker processes.
+            sync_interval (int): The number of rounds between two weight updates of the workers.
+            seed (Seed): The seed of the training cities, see City.generate_cities.
+        """
+        seeds = ScenarioGenerator(self.n, self.m).spawn_seeds(seed, num_cities)
+        workers = []
+        for indices in np.array_split(np.arange(num_cities), min(num_workers, num_cities)):
+            connection, worker_connection = mp.Pipe()
+            process = mp.Process(target=run_rollout_worker, daemon=True,
+                                 args=(worker_connection, self.n, self.m, self.t, num_cars,
+                                       [seeds[index] for index in indices], int(indices[0])))
+            process.start()
+            worker_connection.close()
+            workers.append((process, connection))
+
+        best_score = float('-inf')
+        rounds = 0
+        try:
+            while workers:
+                weights = self.agent.get_weights() if rounds % sync_interval == 0 else None
+                for _, connection in workers:
+                    connection.send(weights)
+
+                running = []
+                for process, connection in workers:
+                    with INSTRUMENTATION.phase('wait_for_worker'):
+                        experiences, reporter, finished_cities, done = connection.recv()
+                    self.agent.memory.store_batch(*experiences)
+                    self.reporter.merge(reporter)
+                    for index, score in finished_cities:
+                        print(f"The score for city {index} is: {score}")
+                        if score > best_score:
+                            self.agent.save_models()
+                            best_score = score
+                    if done:
+                        process.join()
+                    else:
+                        running.append((process, connection))
+                workers = running
+
+                if len(self.agent.memory) > 0:
+                    with INSTRUMENTATION.phase('learn'):
+                        self.agent.learn()
+                rounds += 1
+        finally:
+            for process, _ in workers:
+                process.terminate()
+
+    def collect_tick_experience(self, city: City, t: int) -> Optional[float]:
+        """
+        Runs a training episode on a random occupied neighborhood of the city, storing its experiences in the
+        agent memory. The first WARMUP_TICKS ticks of a city only fill it with cars.
 
-    def get_random_neighborhood(self, city):
-        i = random.randint(0, self.n - NEIGHBORHOOD_N)
-        j = random.randint(0, self.m - NEIGHBORHOOD_M)
+        Args:
+            city (City): The training city.
+            t (int): The current tick of the city.
+
+        Returns:
+            Optional[float]: The average reward of the episode, None during the warm-up ticks.
+        """
+        if t < WARMUP_TICKS:
+            return None
+
+        neighborhood = self.get_random_occupied_neighborhood(city)
+        counter = 0
+        total_reward = 0
+        done = False
+        while not done:
+            counter += 1
+            reward, done = self.neighborhood_iteration(neighborhood, counter)
+            total_reward += reward
+        return total_reward / counter
+
+    def finish_training_city(self, city: City) -> None:
+        """Solves a city the agent was trained on and records the evaluation of the solution."""
+        city.reset_city()
+        solution = self.solve_cities([city])[0]
+        self.reporter.record_best_solutions_scores(self.evaluate_solution(solution, [city], report=True), solution)
+
+    def random_assignment(self) -> np.ndarray:
+        """Returns a random traffic light assignment for the whole city."""
+        return np.random.randint(0, 2, size=(self.n, self.m), dtype=SOLUTION_DTYPE)
+
+    def get_random_occupied_neighborhood(self, city: City) -> Neighborhood:
+        """
+        Draws random neighborhoods until one holds cars. The candidates are checked on the city state views, so only
+        the chosen neighborhood is built.
+        """
+        views = city.get_neighborhood_views(NEIGHBORHOOD_N, NEIGHBORHOOD_M)
+        while True:
+            i = random.randint(0, self.n - NEIGHBORHOOD_N)
+            j = random.randint(0, self.m - NEIGHBORHOOD_M)
+            # The first two representations are the cars waiting to go vertical and horizontal
+            if views[i, j, :, :, :2].any():
+                break
         top_left, top_right, bottom_left = self.build_neighborhood_coords(i, j)
         return city.get_neighborhood(top_left, top_right, bottom_left)
 
@@ -207,35 +349,41 @@ class PPOSolver(Solver):
        Returns:
            np.ndarray: The final traffic light assignment for the city grid.
        """
-        votes = np.zeros((self.n, self.m, 2), dtype=int)
-
-        for i in range(self.n - NEIGHBORHOOD_N + 1):
-            for j in range(self.m - NEIGHBORHOOD_M + 1):
-                action_idx = actions.pop(0)
-                action = self.all_actions[action_idx]
-
-                # Ensure action is 2D and iterate over its elements directly
-                for ni in range(NEIGHBORHOOD_N):
-                    for nj in range(NEIGHBORHOOD_M):
-                        global_i = i + ni
-                        global_j = j + nj
-
-                        if action[ni, nj] == Direction.HORIZONTAL:
-                            votes[global_i][global_j][0] += 1
-                        else:
-                            votes[global_i][global_j][1] += 1
-
-        return self.build_assignments(votes)
-
-    def build_assignments(self, votes: np.ndarray):
-        assignment = np.empty((self.n, self.m), dtype=Direction)
-        for i in range(self.n):
-            for j in range(self.m):
-                if votes[i][j][0] >= votes[i][j][1]:
-                    assignment[i][j] = Direction.HORIZONTAL
-                else:
-                    assignment[i][j] = Direction.VERTICAL
-        return assignment
+        return self.vote_on_assignments(np.array(actions).reshape(1, -1))[0]
+
+    def vote_on_assignments(self, actions: np.ndarray) -> np.ndarray:
+        """
+        Aggregates the votes of the neighborhoods of several cities at once.
+        A junction gets a vertical light only if more neighborhoods voted vertical than horizontal.
+
+        Args:
+            actions (np.ndarray): A (cities, neighborhoods) array of the action indices selected by the agent.
+
+        Returns:
+            np.ndarray: A (cities, n, m) array of the traffic light assignment of every city.
+        """
+        vertical_votes = self.count_votes(actions, self.action_values)
+        vertical = 2 * vertical_votes > self.vote_counts
+        return vertical.astype(SOLUTION_DTYPE)
+
+    def count_votes(self, actions: np.ndarray, action_values: np.ndarray) -> np.ndarray:
+        """
+        Sum the values the chosen actions give to every junction.
+
+        Args:
+            actions (np.ndarray): A (cities, neighborhoods) array of action indices.
+            action_values (np.ndarray): The (actions, NEIGHBORHOOD_N, NEIGHBORHOOD_M) values of every action.
+
+        Returns:
+            np.ndarray: A (cities, n, m) array of the summed values.
+        """
+        rows, cols = self.n - NEIGHBORHOOD_N + 1, self.m - NEIGHBORHOOD_M + 1
+        values = action_values[actions].reshape(len(actions), rows, cols, NEIGHBORHOOD_N, NEIGHBORHOOD_M)
+        votes = np.zeros((len(actions), self.n, self.m), dtype=np.int64)
+        for ni in range(NEIGHBORHOOD_N):
+            for nj in range(NEIGHBORHOOD_M):
+                votes[:, ni:ni + rows, nj:nj + cols] += values[:, :, :, ni, nj]
+        return votes
 
     def evaluate_neighborhood(self, action: int, neighborhood: Neighborhood, report: bool = False) -> Tuple[int, bool]:
         """
@@ -273,10 +421,53 @@ class PPOSolver(Solver):
         return reward, done
 
     def get_wait_time_punishment(self, neighborhood: Neighborhood) -> float:
-        wait_times = neighborhood.grid.get_all_junctions_wait_time()
-        total_punishment = 0
-        for row_wait_times in wait_times:
-            for wait_time in row_wait_times:
-                total_punishment += self.get_junction_wait_time_punishment(wait_time)
+        """Return the wait time punishment of a neighborhood, see Grid.get_wait_time_punishment."""
+        return neighborhood.grid.get_wait_time_punishment()
 
-        return total_punishment
+
+def run_rollout_worker(connection: Connection, n: int, m: int, t: int, num_cars: int,
+                       seeds: List[np.random.SeedSequence], first_index: int) -> None:
+    """
+    The loop of a PPOSolver.train_parallel worker process. For every message (new agent weights or None) it runs
+    one tick of its current city and answers with the collected experiences, the records of its reporter, the
+    scores of the cities it finished and whether it finished all of them.
+
+    Args:
+        connection (Connection): The worker end of the pipe to the learner.
+        n (int): Number of rows in the city grid.
+        m (int): Number of columns in the city grid.
+        t (int): Number of time steps of a training city.
+        num_cars (int): The number of cars in each city.
+        seeds (List[np.random.SeedSequence]): The seeds of the training cities of the worker.
+        first_index (int): The index of the first city of the worker among all the training cities.
+    """
+    # The workers share the cores, every one of them runs its small forward passes on a single thread
+    T.set_num_threads(1)
+    # Forked workers inherit the random state of the learner, draw fresh seeds so they explore differently
+    random.seed()
+    np.random.seed()
+    # The actions are sampled from the torch generator, also inherited
+    T.seed()
+    solver = PPOSolver(n, m, t, Reporter())
+    for offset, seed in enumerate(seeds):
+        city = City.generate_city(n, m, num_cars, seed=seed)
+        total_score = 0
+        for tick in range(t):
+            weights = connection.recv()
+            if weights is not None:
+                solver.agent.set_weights(weights)
+            score = solver.collect_tick_experience(city, tick)
+            if score is not None:
+                total_score += score
+            city.update_city(solver.random_assignment())
+
+            finished_cities = []
+            if tick == t - 1:
+                solver.finish_training_city(city)
+                finished_cities.append((first_index + offset, total_score / t))
+            experiences = tuple(array.numpy().copy() for array in solver.agent.memory.get_arrays())
+            done = tick == t - 1 and offset == len(seeds) - 1
+            connection.send((experiences, solver.reporter, finished_cities, done))
+            solver.agent.memory.clear_memory()
+            solver.reporter = Reporter()
+    connection.close()
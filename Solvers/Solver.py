@@ -1,8 +1,10 @@
 from abc import abstractmethod, ABC
 import numpy as np
-from typing import List, Dict
+from typing import List
 from Model.City import City
 from Model.Reporter import Reporter
+from Model.Solution import to_solution_array
+from Solvers.Evaluator import SerialEvaluator, EVALUATION_BATCH_SIZE
 
 
 class Solver(ABC):
@@ -40,12 +42,17 @@ class Solver(ABC):
         Returns:
         - float: The average waiting time for cars, or infinity if not all cars reach their destinations.
         """
+        # Validated once here, the cities trust the light states of every tick
+        solution = to_solution_array(solution)
         total_avg_wait_time = 0
         not_reaching_cars = 0
         moving_cars_amount = 0
         total_wait_time_punishment = 0
         for city in cities:
             for t in range(self.t):
+                if city.is_drained():
+                    city.fast_forward(solution[t:])
+                    break
                 city.update_city(solution[t], False)
 
             total_avg_wait_time += city.get_current_avg_wait_time()
@@ -62,6 +69,38 @@ class Solver(ABC):
                              total_wait_time_punishment,
                              report)
 
+    def evaluate_solutions(self, solutions: np.ndarray, cities: List[City],
+                           batch_size: int = EVALUATION_BATCH_SIZE) -> np.ndarray:
+        """
+        Evaluates many solutions at once. The solutions x cities simulations are stacked in an ArrayEngine and
+        advanced together, every tick being a few vectorized operations over all of them.
+
+        Parameters:
+        - solutions (np.ndarray): A (P, t, n, m) array of solutions.
+        - cities (List[City]): A list of City objects representing different traffic scenarios.
+        - batch_size (int): The maximum number of solutions simulated together.
+
+        Returns:
+        - np.ndarray: The (P,) scores, the same as evaluate_solution returns for each solution.
+        """
+        evaluator = SerialEvaluator(batch_size)
+        evaluator.set_cities(cities)
+        return self.evaluate_metrics(evaluator.simulate(solutions), cities)
+
+    def evaluate_metrics(self, metrics: np.ndarray, cities: List[City], report: bool = False):
+        """
+        Scores the raw metrics returned by an Evaluator.
+
+        Parameters:
+        - metrics (np.ndarray): A (4,) or (4, P) array of metrics, see Evaluator.simulate.
+        - cities (List[City]): The simulated cities.
+        - report (bool): Whether to record evaluation metrics in the Reporter.
+
+        Returns:
+        - The score, or the (P,) scores.
+        """
+        return self.evaluate(len(cities), len(cities[0].cars), *metrics, report)
+
     def evaluate(self, cities_amount: int,
                  cars_amount: int,
                  not_reaching_cars,
@@ -106,29 +145,9 @@ class Solver(ABC):
         - city (City): The city object containing junctions with wait times.
 
         Returns:
-        - float: The total punishment score for the city.
-        """
-        wait_times = city.get_all_junctions_wait_time()
-        total_punishment = 0
-        for row_wait_times in wait_times:
-            for wait_time in row_wait_times:
-                total_punishment += self.get_junction_wait_time_punishment(wait_time)
-        return total_punishment
-
-    def get_junction_wait_time_punishment(self, wait_time: Dict[str, int]) -> float:
-        """
-        Calculates the punishment for wait times at a single junction.
-
-        Parameters:
-        - wait_time (Dict[str, int]): A dictionary of wait times for each car at the junction.
-
-        Returns:
-        - float: The punishment score for the junction.
+        - float: The total punishment score for the city, see City.get_wait_time_punishment.
         """
-        total = 0
-        for time in wait_time.values():
-            total += time ** 2
-        return total
+        return city.get_wait_time_punishment()
 
     def normalize_not_reaching_cars(self, not_reaching_cars,
                                     cities_amount: int, cars_amount: int, report: bool) -> float:
@@ -0,0 +1,272 @@
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from Model.City import City, OBJECT_ENGINE, ARRAY_ENGINE
+from Model.Reporter import Reporter
+from Solvers.BaseLineSolver import BaseLineSolver
+from Solvers.Evaluator import SerialEvaluator, EVALUATION_BATCH_SIZE
+from Solvers.GeneticSolver import GeneticSolver
+
+# Measures the throughput of the simulator and the solvers, saves the results as a JSON baseline and compares a run
+# against a saved baseline, flagging the cases that got slower.
+#
+#   python Tests/Benchmark.py --profile default --save baseline.json
+#   python Tests/Benchmark.py --profile default --compare baseline.json
+
+# The (n, m, num_cars) cities of every profile, the car density of the 8x8 / 350 cars city grows with the grid
+PROFILES = {
+    'quick': [(8, 8, 350)],
+    'default': [(8, 8, 350), (16, 16, 1400), (32, 32, 5600)],
+    'full': [(8, 8, 350), (16, 16, 1400), (32, 32, 5600), (64, 64, 25000), (128, 128, 100000)],
+}
+# The number of ticks of a simulated solution
+TICKS = 40
+# The number of cities a solution is evaluated on
+NUM_CITIES = 4
+# The population size and generations of the timed genetic algorithm runs, the population must be larger than the
+# default tournament size
+POPULATION_SIZE = 60
+GENERATIONS = 2
+# The maximum number of cars (solutions x cities x cars) the batched evaluations simulate together, so the large
+# profiles run within the memory of a normal machine
+BATCH_CARS = 1000000
+# The population size of the timed breeding (selection, crossover, mutation and elitism) of a generation, capped
+# so a population buffer takes at most BREEDING_MAX_BYTES (a byte per light and tick). Breeding holds the two
+# population buffers and about as much again in parents and random bits.
+BREEDING_POPULATION_SIZE = 10000
+BREEDING_MAX_BYTES = 128 * 2 ** 20
+# The number of experiences in the memory of the timed Agent.learn calls
+LEARN_MEMORY_SIZE = 4000
+# A case is repeated until it ran for MIN_TIME seconds, and at least MIN_REPEATS times
+MIN_TIME = 1.0
+MIN_REPEATS = 3
+# The relative slowdown from the baseline that is reported as a regression
+DEFAULT_TOLERANCE = 0.1
+
+
+def measure(run: Callable[[], None], setup: Callable[[], None] = None) -> float:
+    """
+    Time a call repeatedly and return its fastest time in seconds, the least disturbed by the rest of the machine.
+    :param run: The timed call.
+    :param setup: An untimed call made before every run, e.g. to reset the cities.
+    """
+    times = []
+    while len(times) < MIN_REPEATS or sum(times) < MIN_TIME:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def random_solution(n: int, m: int, t: int) -> np.ndarray:
+    return GeneticSolver(1, 0, 0, n, m, t, Reporter()).generate_random_solution()
+
+
+def bench_update_city(n: int, m: int, num_cars: int, engine: str) -> float:
+    """Ticks per second of City.update_city."""
+    city = City.generate_city(n, m, num_cars, engine)
+    solution = random_solution(n, m, TICKS)
+
+    def run():
+        for assignment in solution:
+            city.update_city(assignment)
+
+    return TICKS / measure(run, city.reset_city)
+
+
+def bench_evaluate_solution(n: int, m: int, num_cars: int, engine: str) -> float:
+    """Cities per second of Solver.evaluate_solution."""
+    cities = City.generate_cities(n, m, num_cars, NUM_CITIES, engine)
+    solver = BaseLineSolver(n, m, TICKS, Reporter())
+    solution = random_solution(n, m, TICKS)
+    return NUM_CITIES / measure(lambda: solver.evaluate_solution(solution, cities))
+
+
+def batch_size(num_cars: int) -> int:
+    """The number of solutions evaluated together, BATCH_CARS simulated cars at most."""
+    return max(1, min(EVALUATION_BATCH_SIZE, BATCH_CARS // (NUM_CITIES * num_cars)))
+
+
+def bench_evaluate_solutions(n: int, m: int, num_cars: int) -> float:
+    """Simulated cities per second of the batched Solver.evaluate_solutions."""
+    cities = City.generate_cities(n, m, num_cars, NUM_CITIES)
+    solver = GeneticSolver(POPULATION_SIZE, 0.025, 0, n, m, TICKS, Reporter())
+    solutions = solver.initialize_population()
+    return POPULATION_SIZE * NUM_CITIES / measure(
+        lambda: solver.evaluate_solutions(solutions, cities, batch_size(num_cars)))
+
+
+def bench_ga_generation(n: int, m: int, num_cars: int) -> float:
+    """Seconds per generation of GeneticSolver.solve, including its city generation."""
+    def run():
+        solver = GeneticSolver(POPULATION_SIZE, 0.025, GENERATIONS, n, m, TICKS, Reporter(),
+                               SerialEvaluator(batch_size(num_cars)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            solver.solve(NUM_CITIES, num_cars)
+
+    return measure(run) / GENERATIONS
+
+
+def breeding_population_size(n: int, m: int) -> int:
+    return min(BREEDING_POPULATION_SIZE, BREEDING_MAX_BYTES // (TICKS * n * m))
+
+
+def bench_ga_breeding(n: int, m: int) -> float:
+    """Seconds per generation of the genetic algorithm operators, without the evaluation."""
+    population_size = breeding_population_size(n, m)
+    solver = GeneticSolver(population_size, 0.025, 0, n, m, TICKS, Reporter())
+    population = solver.initialize_population()
+    fitness_scores = np.random.random(population_size)
+
+    def run():
+        parents = solver.tournament_selection(population, fitness_scores)
+        children = solver.create_children(population, parents)
+        solver.add_best_to_children(children, population[0])
+        # The children buffer became the current one, switch back so every run breeds the same population
+        solver.current_population = 1 - solver.current_population
+
+    return measure(run)
+
+
+def bench_ppo_solve(n: int, m: int, num_cars: int) -> float:
+    """Seconds per tick of PPOSolver.solve."""
+    from Solvers.PPOSolver import PPOSolver
+    solver = PPOSolver(n, m, TICKS, Reporter())
+    city = City.generate_city(n, m, num_cars, ARRAY_ENGINE)
+    return measure(lambda: solver.solve(city)) / TICKS
+
+
+def bench_agent_learn() -> float:
+    """Seconds per Agent.learn call on a memory of LEARN_MEMORY_SIZE experiences."""
+    from PPO.Agent import Agent
+    from Solvers.PPOSolver import BATCH_SIZE, NUM_OF_EPOCHS, MAX_ITERATIONS, PPOSolver
+    solver = PPOSolver(8, 8, TICKS, Reporter())
+    state_dims = solver.get_state_dims()
+    agent = Agent(n_actions=len(solver.all_actions), batch_size=BATCH_SIZE, n_epoch=NUM_OF_EPOCHS,
+                  input_dims=state_dims)
+    rng = np.random.default_rng(0)
+    experiences = (rng.integers(0, 20, (LEARN_MEMORY_SIZE, *state_dims)),
+                   rng.integers(0, len(solver.all_actions), LEARN_MEMORY_SIZE),
+                   np.log(rng.uniform(0.001, 1, LEARN_MEMORY_SIZE)),
+                   rng.normal(size=LEARN_MEMORY_SIZE),
+                   rng.normal(size=LEARN_MEMORY_SIZE),
+                   np.arange(LEARN_MEMORY_SIZE) % MAX_ITERATIONS == MAX_ITERATIONS - 1)
+    # learn clears the memory, so it is filled again before every call
+    return measure(agent.learn, lambda: agent.memory.store_batch(*experiences))
+
+
+def build_cases(profile: str) -> List[Tuple[str, dict, str, bool, Callable[[], float]]]:
+    """
+    List the cases of a profile.
+    :return: The name, parameters, unit, whether higher is better and the measuring call of every case.
+    """
+    cases = []
+    for n, m, num_cars in PROFILES[profile]:
+        size = {'n': n, 'm': m, 'cars': num_cars}
+        for engine in (OBJECT_ENGINE, ARRAY_ENGINE):
+            cases.append(('update_city', {**size, 'engine': engine}, 'ticks/s', True,
+                          lambda n=n, m=m, c=num_cars, e=engine: bench_update_city(n, m, c, e)))
+            cases.append(('evaluate_solution', {**size, 'engine': engine}, 'cities/s', True,
+                          lambda n=n, m=m, c=num_cars, e=engine: bench_evaluate_solution(n, m, c, e)))
+        cases.append(('evaluate_solutions', size, 'cities/s', True,
+                      lambda n=n, m=m, c=num_cars: bench_evaluate_solutions(n, m, c)))
+        cases.append(('ga_generation', size, 's', False, lambda n=n, m=m, c=num_cars: bench_ga_generation(n, m, c)))
+        cases.append(('ga_breeding', {'n': n, 'm': m, 'population': breeding_population_size(n, m)}, 's', False,
+                      lambda n=n, m=m: bench_ga_breeding(n, m)))
+        cases.append(('ppo_solve', size, 's/tick', False, lambda n=n, m=m, c=num_cars: bench_ppo_solve(n, m, c)))
+    cases.append(('agent_learn', {'experiences': LEARN_MEMORY_SIZE}, 's', False, bench_agent_learn))
+    return cases
+
+
+def case_key(name: str, params: dict) -> str:
+    return name + '[' + ','.join(f'{key}={value}' for key, value in params.items()) + ']'
+
+
+def run_cases(profile: str, pattern: str = None) -> Dict[str, dict]:
+    """
+    Run the cases of a profile whose key contains pattern.
+    A case whose dependencies are not installed (e.g. torch for the PPO cases) is skipped.
+    :return: The results by case key.
+    """
+    results = {}
+    for name, params, unit, higher_is_better, bench in build_cases(profile):
+        key = case_key(name, params)
+        if pattern is not None and pattern not in key:
+            continue
+        try:
+            value = bench()
+        except ImportError as error:
+            print(f"{key:<60} skipped ({error})")
+            continue
+        results[key] = {'name': name, 'params': params, 'value': value, 'unit': unit,
+                        'higher_is_better': higher_is_better}
+        print(f"{key:<60} {value:>14.4f} {unit}")
+    return results
+
+
+def machine_info() -> dict:
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'time': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def save_baseline(path: str, profile: str, results: Dict[str, dict]) -> None:
+    with open(path, 'w') as file:
+        json.dump({'profile': profile, 'machine': machine_info(), 'results': results}, file, indent=2)
+
+
+def compare(baseline: Dict[str, dict], results: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Compare results against a baseline.
+    :param tolerance: The relative slowdown that is flagged as a regression.
+    :return: The keys of the regressed cases.
+    """
+    regressions = []
+    print(f"\n{'case':<60} {'baseline':>14} {'current':>14} {'speedup':>8}")
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old, new = baseline[key]['value'], result['value']
+        # Above 1 is faster, whichever way the unit goes
+        speedup = new / old if result['higher_is_better'] else old / new
+        flag = ''
+        if speedup < 1 / (1 + tolerance):
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"{key:<60} {old:>14.4f} {new:>14.4f} {speedup:>7.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulator and the solvers.')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='default')
+    parser.add_argument('--filter', help='Only run the cases whose key contains this text.')
+    parser.add_argument('--save', help='Save the results as a JSON baseline to this file.')
+    parser.add_argument('--compare', help='Compare the results with the JSON baseline in this file.')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='The relative slowdown flagged as a regression.')
+    args = parser.parse_args()
+
+    results = run_cases(args.profile, args.filter)
+    if args.save:
+        save_baseline(args.save, args.profile, results)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -18,3 +18,4 @@ solver = GeneticSolver(population_size, mutation_rate, generations, n, m, t, rep
 best_solution = solver.solve(num_cities, num_cars)
 solver.plot_best_fitness(reporter.best_solutions['fitness'])
 reporter.save_all_data('../ReporterData', 'GA')
+reporter.close()
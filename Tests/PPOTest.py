@@ -15,4 +15,5 @@ solver = PPOSolver(n, m, t, reporter)
 print("Training the solver...")
 solver.train(num_training_cities, num_cars)
 reporter.save_all_data('../ReporterData/PPO', 'PPO')
+reporter.close()
 print("Training completed.")